@@ -0,0 +1,204 @@
+'''Batch runner for the Sokoban searches of solution.py.
+
+Streams a list of levels through a pool of worker processes. Every level runs in its own process with its own time and
+memory budget, and one JSON line is written per level:
+
+    {"level": "3", "algorithm": "iterative_gbfs", "heuristic": "heur_alternate", "weight": 10, "timebound": 5,
+     "nodes": null, "status": "solved", "cost": 31, "expanded": 532, "expanded_first": 61, "expanded_best": 420,
+     "generated": 804, "heuristic_calls": 1630, "wall_time": 0.41, "cpu_time": 0.40}
+
+status is one of solved, unsolved (the search gave up within the budget), timeout (killed after the budget),
+memory (ran out of its memory budget) or error. expanded counts the states expanded by all the rounds of the anytime
+searches, expanded_first and expanded_best those expanded until they found their first and their best solution, and
+generated those of the search that found the returned solution. With nodes, the anytime searches stop after that many
+expansions instead of running until the timebound, which then only guards against levels that expand slowly. Lines are
+flushed as soon as a level finishes, and running the same batch again with the same output file resumes it: levels
+that already have a line with the same algorithm, heuristic, weight, timebound and nodes are skipped.
+
+    python batch.py --algorithm iterative_gbfs --heuristic heur_alternate --timebound 5 --memory 2048 --out nightly.jsonl
+'''
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import traceback
+
+try:
+    import resource  # memory limits, not available on Windows
+except ImportError:
+    resource = None
+
+import solution
+from sokoban import PROBLEMS
+
+ALGORITHMS = ('weighted_astar', 'iterative_astar', 'iterative_gbfs', 'anytime_repairing_astar')
+HEURISTICS = ('heur_zero', 'heur_manhattan_distance', 'heur_alternate')
+
+KILL_GRACE = 2.0  # seconds a level may run past its timebound before its process is killed
+
+
+def solve(state, algorithm, heuristic, weight, timebound, nodes=None):
+    '''Run one search on one level in the current process and return its JSON record (without the level id)'''
+    heur_fn = getattr(solution, heuristic)
+    calls = [0]
+
+    def counted_heur_fn(s):
+        calls[0] += 1
+        return heur_fn(s)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    # the budget counts the expansions of every round of the anytime searches, their stats only the last round's
+    budget = solution.Budget(wall=timebound, nodes=nodes)
+    found = []  # expansions when every better solution was found
+
+    def on_solution(s, bound):
+        found.append(budget.expansions)
+
+    if algorithm == 'weighted_astar':
+        final, stats = solution.weighted_astar(state, counted_heur_fn, weight, timebound)
+        budget.expansions = stats.states_expanded if stats else 0
+        if final:
+            on_solution(final, weight)
+    elif algorithm == 'iterative_astar':
+        final, stats = solution.iterative_astar(state, counted_heur_fn, weight, timebound, on_solution, budget=budget)
+    elif algorithm == 'iterative_gbfs':
+        final, stats = solution.iterative_gbfs(state, counted_heur_fn, timebound, on_solution, budget=budget)
+    elif algorithm == 'anytime_repairing_astar':
+        final, stats = solution.anytime_repairing_astar(state, counted_heur_fn, weight, timebound, on_solution,
+                                                        budget=budget)
+    else:
+        raise ValueError("unknown algorithm " + algorithm)
+    return {
+        'status': 'solved' if final else 'unsolved',
+        'cost': final.gval if final else None,
+        'expanded': budget.expansions,
+        'expanded_first': found[0] if found else None,
+        'expanded_best': found[-1] if found else None,
+        'generated': stats.states_generated if stats else None,
+        'heuristic_calls': calls[0],
+        'wall_time': round(time.perf_counter() - wall_start, 4),
+        'cpu_time': round(time.process_time() - cpu_start, 4),
+    }
+
+
+def _worker(connection, state, algorithm, heuristic, weight, timebound, nodes, memory_mb):
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        record = solve(state, algorithm, heuristic, weight, timebound, nodes)
+    except MemoryError:
+        record = {'status': 'memory'}
+    except Exception:
+        record = {'status': 'error', 'error': traceback.format_exc(limit=5)}
+    connection.send(record)
+    connection.close()
+
+
+def run_settings(algorithm, heuristic, weight, timebound, nodes=None):
+    '''The settings of a batch, which every record repeats: a level is only done for the settings it was solved with'''
+    return {'algorithm': algorithm, 'heuristic': heuristic, 'weight': weight, 'timebound': timebound, 'nodes': nodes}
+
+
+def completed_levels(out_path, settings):
+    '''Ids of the levels that already have a line with settings in the output file'''
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short when the batch was interrupted
+                if 'level' in record and all(record.get(key) == value for (key, value) in settings.items()):
+                    done.add(record['level'])
+    return done
+
+
+def run_batch(levels, out_path, algorithm='iterative_gbfs', heuristic='heur_alternate', weight=10, timebound=5,
+              memory_mb=None, processes=None, nodes=None):
+    '''Solve every (level id, sokoban state) of levels that is not already in out_path with the same settings,
+    appending one JSON line per level to it. Runs up to processes levels at the same time (default: one per core).
+    Returns the new records.'''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    settings = run_settings(algorithm, heuristic, weight, timebound, nodes)
+    done = completed_levels(out_path, settings)
+    pending = [(str(level_id), state) for (level_id, state) in levels if str(level_id) not in done]
+    pending.reverse()
+    running = {}  # process sentinel -> (level id, process, connection, kill time)
+    records = []
+    with open(out_path, 'a') as out:
+        while pending or running:
+            while pending and len(running) < processes:
+                (level_id, state) = pending.pop()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_worker, args=(sender, state, algorithm, heuristic, weight,
+                                                                        timebound, nodes, memory_mb))
+                process.start()
+                sender.close()
+                running[process.sentinel] = (level_id, process, receiver, time.time() + timebound + KILL_GRACE)
+
+            next_kill = min(kill for (_, _, _, kill) in running.values())
+            multiprocessing.connection.wait(list(running), max(next_kill - time.time(), 0))
+            now = time.time()
+            for sentinel in list(running):
+                (level_id, process, receiver, kill) = running[sentinel]
+                if receiver.poll():
+                    try:
+                        record = receiver.recv()
+                    except EOFError:
+                        record = {'status': 'error'}
+                elif not process.is_alive():
+                    # killed by the operating system, usually for memory
+                    record = {'status': 'memory' if memory_mb else 'error'}
+                elif now >= kill:
+                    process.terminate()
+                    record = {'status': 'timeout'}
+                else:
+                    continue
+                process.join()
+                receiver.close()
+                del running[sentinel]
+                record = dict(dict({'level': level_id}, **settings), **record)
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                records.append(record)
+    return records
+
+
+def parse_levels(spec):
+    '''Level ids of PROBLEMS from a specification like "0-9,12"; all of them if spec is empty'''
+    if not spec:
+        return list(range(len(PROBLEMS)))
+    ids = []
+    for part in spec.split(','):
+        if '-' in part:
+            (first, last) = part.split('-')
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve a batch of Sokoban levels, one JSON line per level.')
+    parser.add_argument('--out', required=True, help='JSONL output file, resumed if it exists')
+    parser.add_argument('--levels', default='', help='ids of PROBLEMS to solve, e.g. 0-9,12 (default: all)')
+    parser.add_argument('--algorithm', default='iterative_gbfs', choices=ALGORITHMS)
+    parser.add_argument('--heuristic', default='heur_alternate', choices=HEURISTICS)
+    parser.add_argument('--weight', type=float, default=10)
+    parser.add_argument('--timebound', type=float, default=5, help='seconds per level')
+    parser.add_argument('--nodes', type=int, default=None, help='states the anytime searches expand per level')
+    parser.add_argument('--memory', type=int, default=None, help='megabytes per level')
+    parser.add_argument('--processes', type=int, default=None, help='levels solved at the same time')
+    args = parser.parse_args()
+
+    levels = [(i, PROBLEMS[i]) for i in parse_levels(args.levels)]
+    for record in run_batch(levels, args.out, args.algorithm, args.heuristic, args.weight, args.timebound,
+                            args.memory, args.processes, args.nodes):
+        print(json.dumps(record))
@@ -0,0 +1,185 @@
+'''Benchmark of the Sokoban searches of solution.py with regression tracking.
+
+Runs every heuristic with every algorithm over PROBLEMS and a set of generated levels that are larger than the course
+levels, using the batch runner (batch.py) so that every level gets its own process and budget. The anytime searches
+stop after --nodes expansions rather than at the timebound, so that what they find does not depend on the speed of the
+machine; the timebound only stops levels that expand too slowly. For every (level, algorithm, heuristic) it records
+whether the level was solved, the solution cost, the states expanded until the first and the best solution and the
+wall time.
+
+    python benchmark.py --save-baseline baseline.json      # measure and store a baseline
+    python benchmark.py --baseline baseline.json           # measure and compare, exit status 1 on a regression
+
+A run regresses against the baseline when a level that was solved is not solved any more, when a solution got more
+expensive, or when a level expands more than --threshold (a fraction) more states before its first or its best
+solution. Times depend on the machine and on what else runs on it, so by default they are not part of the check: the
+levels that take more than --time-threshold more wall time are only reported (differences under TIME_FLOOR seconds are
+ignored). With --fail-slower they count as regressions too, for baselines made on the same machine.
+
+    python benchmark.py --baseline baseline.json --fail-slower
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+import batch
+from sokoban import PROBLEMS, SokobanState
+
+ALGORITHMS = ('weighted_astar', 'iterative_astar', 'iterative_gbfs')
+HEURISTICS = ('heur_zero', 'heur_manhattan_distance', 'heur_alternate')
+
+# (width, height, boxes, seed) of the generated levels
+GENERATED_LEVELS = ((8, 8, 4, 1), (9, 9, 5, 2), (10, 10, 5, 3), (10, 12, 6, 4), (12, 12, 7, 5), (14, 14, 8, 6))
+
+TIME_FLOOR = 0.05  # seconds
+NODES = 20000  # states expanded by the anytime searches per level
+
+
+def generate_level(width, height, boxes, seed, obstacle_density=0.1, steps=None):
+    '''A solvable level of the given size: boxes start on the storage points and a robot walks backwards from there,
+    pulling boxes along. Reversed, its walk is a solution of the level it ends in.'''
+    rng = random.Random(seed)
+    if steps is None:
+        steps = 30 * width * height
+    squares = [(x, y) for x in range(width) for y in range(height)]
+    while True:
+        obstacles = set(rng.sample(squares, int(obstacle_density * width * height)))
+        floor = [square for square in squares if square not in obstacles]
+        placed = rng.sample(floor, boxes + 1)
+        storage = frozenset(placed[:boxes])
+        robot = placed[boxes]
+        box_set = set(storage)
+        for _ in range(steps):
+            (dx, dy) = rng.choice(((0, 1), (0, -1), (1, 0), (-1, 0)))
+            target = (robot[0] + dx, robot[1] + dy)
+            if not (0 <= target[0] < width and 0 <= target[1] < height) or target in obstacles or target in box_set:
+                continue
+            behind = (robot[0] - dx, robot[1] - dy)
+            if behind in box_set and rng.random() < 0.5:
+                box_set.remove(behind)
+                box_set.add(robot)
+            robot = target
+        if len(box_set - storage) >= (boxes + 1) // 2:
+            return SokobanState("START", 0, None, width, height, (robot,), frozenset(box_set), storage,
+                                frozenset(obstacles))
+
+
+def benchmark_levels():
+    '''(level id, sokoban state) of every level of the benchmark'''
+    levels = [(str(i), state) for (i, state) in enumerate(PROBLEMS)]
+    for (width, height, boxes, seed) in GENERATED_LEVELS:
+        levels.append(('gen-%dx%d-%d-%d' % (width, height, boxes, seed), generate_level(width, height, boxes, seed)))
+    return levels
+
+
+def run_benchmark(levels, weight=5, timebound=10, memory_mb=None, processes=None, algorithms=ALGORITHMS,
+                  heuristics=HEURISTICS, nodes=NODES):
+    '''Run every algorithm with every heuristic on levels. Returns a dictionary from "level/algorithm/heuristic" to
+    its batch record.'''
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for algorithm in algorithms:
+            for heuristic in heuristics:
+                out_path = os.path.join(directory, algorithm + '-' + heuristic + '.jsonl')
+                for record in batch.run_batch(levels, out_path, algorithm, heuristic, weight, timebound, memory_mb,
+                                              processes, nodes):
+                    results['/'.join((record['level'], algorithm, heuristic))] = record
+    return results
+
+
+def compare(baseline, results, threshold=0.1):
+    '''Regressions of results against baseline in solved levels, solution cost and expansions until the first and the
+    best solution, as one message per regression'''
+    regressions = []
+    for key in sorted(baseline):
+        old = baseline[key]
+        new = results.get(key)
+        if new is None or old['status'] != 'solved':
+            continue
+        if new['status'] != 'solved':
+            regressions.append('%s: %s, was solved' % (key, new['status']))
+            continue
+        if new['cost'] > old['cost']:
+            regressions.append('%s: cost %d, was %d' % (key, new['cost'], old['cost']))
+        for (field, solution_name) in (('expanded_first', 'first'), ('expanded_best', 'best')):
+            if new[field] > old[field] * (1 + threshold):
+                regressions.append('%s: %d states expanded to the %s solution, was %d' % (key, new[field], solution_name,
+                                                                                          old[field]))
+    return regressions
+
+
+def slower(baseline, results, time_threshold=0.25):
+    '''Levels solved in both that take more than time_threshold (a fraction) more wall time than in baseline, as one
+    message per level'''
+    messages = []
+    for key in sorted(baseline):
+        old = baseline[key]
+        new = results.get(key)
+        if new is None or old['status'] != 'solved' or new['status'] != 'solved':
+            continue
+        if new['wall_time'] > old['wall_time'] * (1 + time_threshold) and \
+                new['wall_time'] - old['wall_time'] > TIME_FLOOR:
+            messages.append('%s: %.2fs, was %.2fs' % (key, new['wall_time'], old['wall_time']))
+    return messages
+
+
+def summarize(results):
+    '''Print the levels solved, states expanded and wall time of every algorithm and heuristic'''
+    totals = {}
+    for (key, record) in results.items():
+        (_, algorithm, heuristic) = key.rsplit('/', 2)
+        total = totals.setdefault((algorithm, heuristic), [0, 0, 0, 0.0])
+        total[1] += 1
+        if record['status'] == 'solved':
+            total[0] += 1
+            total[2] += record['expanded'] or 0
+            total[3] += record['wall_time']
+    print('%-18s %-24s %8s %12s %9s' % ('algorithm', 'heuristic', 'solved', 'expanded', 'wall'))
+    for ((algorithm, heuristic), (solved, levels, expanded, wall_time)) in sorted(totals.items()):
+        print('%-18s %-24s %8s %12d %8.2fs' % (algorithm, heuristic, '%d/%d' % (solved, levels), expanded, wall_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Sokoban searches and compare with a baseline.')
+    parser.add_argument('--baseline', help='baseline file to compare with')
+    parser.add_argument('--save-baseline', help='file to store the results in as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed fraction of extra expansions')
+    parser.add_argument('--time-threshold', type=float, default=0.25,
+                        help='fraction of extra wall time above which a level is reported')
+    parser.add_argument('--fail-slower', action='store_true',
+                        help='count the levels above --time-threshold as regressions')
+    parser.add_argument('--weight', type=float, default=5)
+    parser.add_argument('--timebound', type=float, default=10, help='seconds per level at most')
+    parser.add_argument('--nodes', type=int, default=NODES, help='states the anytime searches expand per level')
+    parser.add_argument('--memory', type=int, default=None, help='megabytes per level')
+    parser.add_argument('--processes', type=int, default=None, help='levels solved at the same time')
+    args = parser.parse_args()
+
+    settings = {'weight': args.weight, 'timebound': args.timebound, 'nodes': args.nodes}
+    results = run_benchmark(benchmark_levels(), args.weight, args.timebound, args.memory, args.processes,
+                            nodes=args.nodes)
+    summarize(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print('warning: the baseline was made with', baseline['settings'])
+        slow = slower(baseline['results'], results, args.time_threshold)
+        for message in slow:
+            print('SLOWER', message)
+        regressions = compare(baseline['results'], results, args.threshold)
+        if args.fail_slower:
+            regressions += ['slower ' + message for message in slow]
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against', args.baseline)
@@ -7,6 +7,20 @@
 
 import os  # for time functions
 import math  # for infinity
+import random  # for the zobrist keys
+import mmap  # for the pattern database files
+import struct  # for the pattern database files
+import hashlib  # for the pattern database file names
+import sys  # for the largest float
+import heapq  # for the open list of anytime repairing a-star
+import multiprocessing  # for the portfolio solver
+import time  # for wall clock deadlines
+import csv  # for the profiler exports
+try:
+    import resource  # for memory budgets, not available on Windows
+except ImportError:
+    resource = None
+from collections import OrderedDict, deque  # for the transposition table and breadth first searches
 from search import *  # for search engines
 from sokoban import sokoban_goal_state, SokobanState, Direction, PROBLEMS  # for Sokoban specific classes and problems
 
@@ -22,164 +36,58 @@ def heur_alternate(state):
     # EXPLAIN YOUR HEURISTIC IN THE COMMENTS. Please leave this function (and your explanation) at the top of your solution file, to facilitate marking.
 
     # Steps for calculating heuristic:
-    # Determine unsolvable states in which we return infinity:
+    # Determine unsolvable states in which we return infinity (a Deadlock, which records the rule that found it):
     # 1. If the number of storages is less than that of boxes
-    # 2. If there are boxes in the corner but there is no storage at that corner
-    # 3. If a box is blocked in either up and left, or up and right, or down and left, or down and right directions or more
-    # 4. If a box is along the wall, and there is an immediate box or obstacle on the same direction of the wall that is beside the box
-    # 5. If two boxes are immediate beside each other, and there are at least two obstacles blocking each of them on the longer side
-    # 6. The number of storages on a side of the wall is less than the number of boxes on that side of the wall
+    # 2. If a box is on a dead square, a square from which no storage can be reached by pushes (the pull distances of
+    #    the level, see below, are all infinite). Corners without storage and walls without storage are dead squares.
+    # 3. If two boxes are immediately beside each other and each of them is blocked by an obstacle or the wall above or
+    #    below it (or, for boxes on top of each other, to its left or right)
+    # 4. If a box is along the wall, and there is an immediate box beside it along the same wall
+    # 5. The number of storages on a side of the wall is less than the number of boxes on that side of the wall
+    # 6. If the boxes cannot all be matched to distinct storages they can reach
 
     # Next, check if there are any immediate surrounding boxes (in the up, down, left, right) directions, if so, add the number of them to
-    # the heuristic value for penalty (i.e. they might cause re-routing which costs more steps and time, or leading to unsolvable state)
+    # the heuristic value for penalty (i.e. they might cause re-routing which costs more steps and time, or leading to unsolvable state).
+    # Boxes along the bottom wall are not penalized.
 
-    # Finally, calculate the shortest distances between each box and the storage where each storage can only be occupied once, 
-    # also calculate the shortest distances between each box and the robot, add these two numbers to the heuristic value.
-    # Additional to this, also add the number of obstacles that is within the area enclosed by the box and the storage, and enclosed
-    # by the box and the robot, each obstacle adds 1 to the heuristic value.
+    # Then add the pull distances of the boxes: for every square of the level and every storage, the least number of
+    # pushes that brings a box from the square to the storage, ignoring the other boxes (a breadth first search of
+    # pulls away from each storage, done once per level). Every box is matched to a distinct storage so that the sum
+    # of these distances is minimal (see MATCHING), boxes already on a storage cost nothing if they stay.
+    # Finally, for every box that is not on a storage, add the Manhattan distance to the nearest robot plus the number
+    # of obstacles within the rectangle enclosed by the box and that robot, each obstacle adds 1 to the heuristic value.
     
+    # Every successor differs from its parent by the robot and at most one box. Everything that only depends on the
+    # boxes (deadlocks, penalties, wall counts and the matching) is kept per box layout and carried over from the
+    # parent, so only the pushed box and its neighbours are evaluated again (see alternate_terms)
+
     # Check the number of storages and the boxes before executing
     if (len(state.storage) < len(state.boxes)):
-        return math.inf
-
-    # Find the coordinates of the walls and obstacles to cover the case where the box is next to the wall
-    walls = set()
-    for width in range(state.width):
-        walls.add((width, -1))
-        walls.add((width, state.height))
-    for height in range(state.height):
-        walls.add((-1, height))
-        walls.add((state.width, height))
-
-    # combine all the blocked ocrrdinates
-    obstacle_and_wall = state.obstacles.union(walls)
-    # Initialize manhatten distance 
-    res = 0
-
-    box_on_wall_up_wall = set()
-    box_on_wall_down_wall = set()
-    box_on_wall_left_wall = set()
-    box_on_wall_right_wall = set()
-    
-
-    # coordinates for corners
-    corners_for_box = [(0, 0), (0, state.height - 1), (state.width - 1, 0), (state.width - 1, state.height - 1)]
-
-    for box in state.boxes:
-        if box not in state.storage:
-            # Base case: if box is in the corner, then the state is unsolvable. Return a heuristic of infinity
-            if box in corners_for_box:
-                return math.inf
-
-            # Find the positions for moving the box in the four basic directions 
-            up_pos = (box[0], box[1] - 1) 
-            up_pos_bool = up_pos in obstacle_and_wall 
-            down_pos = (box[0], box[1] + 1)
-            down_pos_bool = down_pos in obstacle_and_wall 
-            left_pos = (box[0] - 1, box[1])
-            left_pos_bool = left_pos in obstacle_and_wall 
-            right_pos = (box[0] + 1, box[1])
-            right_pos_bool = right_pos in obstacle_and_wall 
-
-            # If a box is blocked in two or more directions by obstacles or walls, then it is blocked, so the state is unsolvable
-            if (up_pos_bool and (left_pos_bool or right_pos_bool)) or (down_pos_bool and (left_pos_bool or right_pos_bool)):
-                return math.inf
-            
-            # If a box is blocked by an obstacle in the y direction with the same x coordinate, then if there is a horizontal neighbour box and is also blocked
-            # in any of its y direction, then the state is unsolvable
-            if (up_pos_bool or down_pos_bool) and ((left_pos in state.boxes and ((left_pos[0], left_pos[1] + 1) in obstacle_and_wall or (left_pos[0], left_pos[1] - 1) in obstacle_and_wall)) or (right_pos in state.boxes and ((right_pos[0], right_pos[1] + 1) in obstacle_and_wall or (right_pos[0], right_pos[1] - 1) in obstacle_and_wall))):
-                return math.inf
-            # If a box is blocked by an obstacle in the x direction with the same y coordinate, then if there is a horizontal neighbour box and is also blocked
-            # in any of its y direction, then the state is unsolvable
-            if (left_pos_bool or right_pos_bool) and ((up_pos in state.boxes and ((up_pos[0] - 1, up_pos[1]) in obstacle_and_wall or (up_pos[0] + 1, up_pos[1]) in obstacle_and_wall)) or (down_pos in state.boxes and ((down_pos[0] - 1, down_pos[1]) in obstacle_and_wall or (down_pos[0] + 1, down_pos[1]) in obstacle_and_wall))):
-                return math.inf
-            
-            # If box is on the left/right wall and there is a consecutive box or obstacle below or above it, the the state is unsolvable
-            if box[0] == 0:
-                if (box[0], box[1] + 1) in state.boxes or (box[0], box[1] - 1) in state.boxes or (box[0], box[1] + 1) in state.obstacles or (box[0], box[1] - 1) in state.obstacles:
-                    return math.inf
-                else:
-                    box_on_wall_left_wall.add(box)
-            
-            if box[0] == state.width - 1:
-                if (box[0], box[1] + 1) in state.boxes or (box[0], box[1] - 1) in state.boxes or (box[0], box[1] + 1) in state.obstacles or (box[0], box[1] - 1) in state.obstacles:
-                    return math.inf
-                else:
-                    box_on_wall_right_wall.add(box)
-            
-            # If box is on the up/down wall and there is a consecutive box below or above it, the the state is unsolvable
-            if box[1] == 0:
-                if (box[0] + 1, box[1]) in state.boxes or (box[0] - 1, box[1]) in state.boxes or (box[0] + 1, box[1]) in state.obstacles or (box[0] - 1, box[1]) in state.obstacles:
-                    return math.inf
-                else:
-                    box_on_wall_up_wall.add(box)
-
-            if box[1] == state.height - 1:
-                if (box[0] + 1, box[1]) in state.boxes or (box[0] - 1, box[1]) in state.boxes or (box[0] + 1, box[1]) in state.obstacles or (box[0] - 1, box[1]) in state.obstacles:
-                    return math.inf
-                else:
-                    box_on_wall_down_wall.add(box)
-            
-            # penalize for crowded boxes as it might increase the number of pushes
-            else:
-                res += len(set((up_pos, down_pos, left_pos, right_pos)).intersection(state.boxes))
-
-            
-            
-    # Collect the x and y positions to see if there are sufficient storages on wall sides for the boxes on the wall sides.
-    storage_on_wall_up_wall = set()
-    storage_on_wall_down_wall = set()
-    storage_on_wall_left_wall = set()
-    storage_on_wall_right_wall = set()
-
-    storage_notassigned = set()
-
-    # Find storages that are on the wall, if the number of storages < number of boxes on the side of the wall, then the state is unsolvable
-    for storage in state.storage:
-        if storage not in state.boxes:
-            if storage[0] == 0:
-                storage_on_wall_left_wall.add(storage)
-            if storage[0] == state.width - 1:
-                storage_on_wall_right_wall.add(storage)
-            if storage[1] == 0:
-                storage_on_wall_up_wall.add(storage)
-            if storage[1] == state.height - 1:
-                storage_on_wall_down_wall.add(storage)
-            storage_notassigned.add(storage)
-
-    if len(storage_on_wall_left_wall) < len(box_on_wall_left_wall) or len(storage_on_wall_right_wall) < len(box_on_wall_right_wall) or len(storage_on_wall_up_wall) < len(box_on_wall_up_wall) or len(storage_on_wall_down_wall) < len(box_on_wall_down_wall):
-        return math.inf
-    
-
-    # Find the minimum distances between boxes and storages and add it to res, each storage can only be pushed to once
-    for box in state.boxes:
-        if box not in state.storage:
-            min_distance = math.inf
-            current_used_storage = None
-            for storage in storage_notassigned:
-                dist = abs(box[0] - storage[0]) + abs(box[1] - storage[1])
-                if dist < min_distance:
-                    current_used_storage = storage
-                    min_distance = dist
-            storage_notassigned.remove(current_used_storage)
-            res += min_distance + obstacle_in_between(box, current_used_storage, state.obstacles)
+        return TOO_FEW_STORAGES
+    level = analyze_level(state)
+    terms = alternate_terms(state, level)
+    res = terms.value
 
     # Find the minimum distances between boxes and robots and add it to res
-    for box in state.boxes:
-        if box not in state.storage:
+    if res != math.inf:
+        for box in terms.contributions:
             min_distance = math.inf
             best_robot = None
             for robot in state.robots:
                 dist = abs(robot[0]-box[0]) + abs(robot[1]-box[1])
-                min_distance = min(dist, min_distance)
-                best_robot = robot
-            res += min_distance + obstacle_in_between(best_robot, box, state.obstacles)
+                if dist < min_distance:
+                    min_distance = dist
+                    best_robot = robot
+            res += min_distance + obstacle_in_between(best_robot, box, level.obstacle_index)
 
     return res
             
 
 def obstacle_in_between(box, storage, obstacle):
     '''Calculate the distance between the box and the storage by adding the number of obstacles in between'''
+    # obstacle is either the RegionIndex of the obstacles of the level (O(1)) or a plain collection of obstacles
+    if isinstance(obstacle, RegionIndex):
+        return obstacle.count(box, storage)
     res = 0
     (up, low) = (min(box[1], storage[1]), max(box[1], storage[1]))
     (left, right) = (min(box[0], storage[0]), max(box[0], storage[0]))
@@ -190,6 +98,952 @@ def obstacle_in_between(box, storage, obstacle):
     return res
 
 
+# LEVEL ANALYSIS
+# Everything in this section only depends on the board layout (size, obstacles and storages), which is shared by every
+# state of a search. It is computed once per layout and cached, so the heuristics only pay for per-box lookups.
+# Squares are numbered row by row: square (x, y) has index x + y * width.
+_DIRECTIONS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+class LevelAnalysis:
+    '''Static analysis of a sokoban level: dead squares and push distances to every storage'''
+
+    def __init__(self, width, height, obstacles, storage):
+        self.width = width
+        self.height = height
+        self.obstacles = frozenset(obstacles)
+        self.storage_set = frozenset(storage)
+        self.storage = tuple(sorted(storage))
+        self.storage_index = dict((s, k) for (k, s) in enumerate(self.storage))
+
+        # obstacles plus the wall that surrounds the board
+        walls = set()
+        for x in range(width):
+            walls.add((x, -1))
+            walls.add((x, height))
+        for y in range(height):
+            walls.add((-1, y))
+            walls.add((width, y))
+        self.obstacle_and_wall = frozenset(obstacles).union(walls)
+
+        self.storage_mask = 0
+        for s in self.storage:
+            self.storage_mask |= 1 << (s[0] + s[1] * width)
+
+        # number of obstacles in any rectangle of the board
+        self.obstacle_index = RegionIndex(width, height, obstacles)
+
+        self.floor = bytearray(width * height)
+        for y in range(height):
+            for x in range(width):
+                if (x, y) not in obstacles:
+                    self.floor[x + y * width] = 1
+
+        # push_distance[square][k] is the least number of pushes that moves a box from square to the k-th storage,
+        # ignoring all other boxes (math.inf if the storage can never be reached)
+        self.push_distance = [None] * (width * height)
+        distances = [self._pull_distances(s) for s in self.storage]
+        for square in range(width * height):
+            if self.floor[square]:
+                self.push_distance[square] = tuple(d[square] for d in distances)
+
+        # the same table with a finite cost for unreachable storages, as used by the box assignment
+        self.push_cost = [None] * (width * height)
+        for square in range(width * height):
+            if self.floor[square]:
+                self.push_cost[square] = tuple(d if d != math.inf else _NO_PATH for d in self.push_distance[square])
+
+        # dead[square] is 1 if a box on square can never be pushed onto any storage (simple deadlock)
+        self.dead = bytearray(width * height)
+        for square in range(width * height):
+            if not self.floor[square] or min(self.push_distance[square], default=math.inf) == math.inf:
+                self.dead[square] = 1
+
+        # Manhattan distance from every square to the nearest storage, ignoring obstacles
+        self.nearest_storage = [min((abs(x - s[0]) + abs(y - s[1]) for s in self.storage), default=math.inf)
+                                for y in range(height) for x in range(width)]
+
+        # number of storages along each side of the wall (left, right, up, down)
+        self.storage_on_wall = (sum(1 for s in self.storage if s[0] == 0), sum(1 for s in self.storage if s[0] == width - 1),
+                                sum(1 for s in self.storage if s[1] == 0), sum(1 for s in self.storage if s[1] == height - 1))
+
+    def square(self, index):
+        '''The (x, y) coordinates of a square index'''
+        return (index % self.width, index // self.width)
+
+    def is_floor(self, x, y):
+        '''True if (x, y) is on the board and not an obstacle'''
+        return 0 <= x < self.width and 0 <= y < self.height and self.floor[x + y * self.width] == 1
+
+    def _pull_distances(self, storage):
+        '''Breadth first search of "pulls" away from a storage: a box at p is pulled to p + d by a robot standing
+        at p + 2d, which is the reverse of pushing the box from p + d to p. Returns the number of pushes needed to
+        bring a box from every square to the storage.'''
+        width = self.width
+        dist = [math.inf] * (width * self.height)
+        dist[storage[0] + storage[1] * width] = 0
+        frontier = [storage]
+        while frontier:
+            next_frontier = []
+            for (x, y) in frontier:
+                d = dist[x + y * width] + 1
+                for (dx, dy) in _DIRECTIONS:
+                    if self.is_floor(x + dx, y + dy) and self.is_floor(x + 2 * dx, y + 2 * dy):
+                        square = x + dx + (y + dy) * width
+                        if dist[square] == math.inf:
+                            dist[square] = d
+                            next_frontier.append((x + dx, y + dy))
+            frontier = next_frontier
+        return dist
+
+
+class RegionIndex:
+    '''Summed-area table of a set of squares: counts the squares of the set inside any rectangle of the board
+    in O(1), after an O(width * height) construction'''
+
+    def __init__(self, width, height, squares):
+        self.width = width
+        self.height = height
+        # table[(x + 1) + (y + 1) * (width + 1)] is the number of squares (i, j) of the set with i <= x and j <= y
+        stride = width + 1
+        table = [0] * (stride * (height + 1))
+        for y in range(height):
+            row = 0
+            for x in range(width):
+                if (x, y) in squares:
+                    row += 1
+                table[x + 1 + (y + 1) * stride] = table[x + 1 + y * stride] + row
+        self.table = table
+
+    def count(self, corner, opposite):
+        '''Number of squares of the set in the rectangle between two opposite corners (both included)'''
+        (left, right) = (max(min(corner[0], opposite[0]), 0), min(max(corner[0], opposite[0]), self.width - 1))
+        (up, low) = (max(min(corner[1], opposite[1]), 0), min(max(corner[1], opposite[1]), self.height - 1))
+        if left > right or up > low:
+            return 0
+        table = self.table
+        stride = self.width + 1
+        return (table[right + 1 + (low + 1) * stride] - table[left + (low + 1) * stride]
+                - table[right + 1 + up * stride] + table[left + up * stride])
+
+
+_levels = {}  # cache of LevelAnalysis, keyed by the board layout
+_last_level = None
+
+def analyze_level(state):
+    '''Return the (cached) LevelAnalysis of the board of a sokoban state'''
+    global _last_level
+    if isinstance(state, PackedSokobanState):
+        return state.level
+    # all the states of a search share the same obstacles and storage objects, so most calls stop here
+    if _last_level is not None and _last_level[0] is state.obstacles and _last_level[1] is state.storage:
+        return _last_level[2]
+    key = (state.width, state.height, state.obstacles, state.storage)
+    level = _levels.get(key)
+    if level is None:
+        level = LevelAnalysis(state.width, state.height, state.obstacles, state.storage)
+        _levels[key] = level
+    _last_level = (state.obstacles, state.storage, level)
+    return level
+
+
+# BOX ASSIGNMENT
+# How boxes are matched to storages in heur_alternate: 'hungarian' for the minimum cost perfect matching, 'greedy' for
+# each box taking its nearest free storage in iteration order. There is no automatic fallback from one to the other:
+# with 'hungarian' every state gets the full matching, whatever the number of boxes.
+MATCHING = 'hungarian'
+
+_NO_PATH = 10 ** 6  # cost of pushing a box to a storage it can never reach
+
+class Assignment:
+    '''Minimum cost assignment of n rows (boxes) to distinct columns (m >= n storages).
+    Hungarian algorithm in its shortest augmenting path form (Jonker-Volgenant): every row is added with one
+    Dijkstra search over reduced costs. The dual potentials are kept, so when the costs of a single row change
+    the row is re-matched with one more augmentation, O(n * m), instead of solving from scratch in O(n^2 * m).'''
+    __slots__ = ('costs', 'n', 'u', 'v', 'row_of')
+
+    def __init__(self, costs):
+        # costs[r][c] is the cost of matching row r with column c; internally rows and columns are numbered from 1
+        # and column 0 is the free column the augmenting paths start from. The matrix is made square with rows
+        # of zeros (storages left empty), which keeps the potentials valid when a single row is re-matched.
+        self.costs = list(costs)
+        self.n = len(self.costs)
+        m = len(self.costs[0]) if self.n else 0
+        self.costs.extend([(0,) * m] * (m - self.n))
+        n = m
+        self.u = [0] * (n + 1)
+        self.v = [0] * (m + 1)
+        self.row_of = [0] * (m + 1)  # row_of[column] = matched row, 0 if the column is free
+        for row in range(1, n + 1):
+            self._augment(row)
+
+    def update(self, row, costs):
+        '''Return a new Assignment where the costs of row (0-based) are replaced, the old one is left untouched'''
+        new = Assignment.__new__(Assignment)
+        new.n = self.n
+        new.costs = list(self.costs)
+        new.costs[row] = costs
+        new.u = list(self.u)
+        new.v = list(self.v)
+        new.row_of = list(self.row_of)
+        row += 1
+        # free the column of the row, then lower its potential so that all its reduced costs are non-negative again
+        new.row_of[new.row_of.index(row, 1)] = 0
+        v = new.v
+        new.u[row] = min(costs[c - 1] - v[c] for c in range(1, len(v)))
+        new._augment(row)
+        return new
+
+    def _augment(self, row):
+        '''Match a free row by the shortest augmenting path, updating the potentials'''
+        costs, u, v, row_of = self.costs, self.u, self.v, self.row_of
+        m = len(v) - 1
+        min_reduced = [math.inf] * (m + 1)
+        way = [0] * (m + 1)
+        used = [False] * (m + 1)
+        row_of[0] = row
+        column = 0
+        while True:
+            used[column] = True
+            current_row = row_of[column]
+            current_costs = costs[current_row - 1]
+            current_u = u[current_row]
+            delta = math.inf
+            next_column = 0
+            for c in range(1, m + 1):
+                if not used[c]:
+                    reduced = current_costs[c - 1] - current_u - v[c]
+                    if reduced < min_reduced[c]:
+                        min_reduced[c] = reduced
+                        way[c] = column
+                    if min_reduced[c] < delta:
+                        delta = min_reduced[c]
+                        next_column = c
+            for c in range(m + 1):
+                if used[c]:
+                    u[row_of[c]] += delta
+                    v[c] -= delta
+                else:
+                    min_reduced[c] -= delta
+            column = next_column
+            if row_of[column] == 0:
+                break
+        # flip the augmenting path
+        while column:
+            previous = way[column]
+            row_of[column] = row_of[previous]
+            column = previous
+
+    def column_of(self, row):
+        '''The column (0-based) matched with a row (0-based)'''
+        return self.row_of.index(row + 1, 1) - 1
+
+    def total(self):
+        '''Cost of the assignment'''
+        costs, n = self.costs, self.n
+        return sum(costs[r - 1][c - 1] for (c, r) in enumerate(self.row_of) if c and r <= n)
+
+
+class BoxAssignment:
+    '''The assignment of the boxes of one state: which box is which row of the Assignment'''
+    __slots__ = ('rows', 'assignment')
+
+    def __init__(self, rows, assignment):
+        self.rows = rows  # box -> row
+        self.assignment = assignment
+
+    @staticmethod
+    def build(boxes, level):
+        boxes = list(boxes)
+        rows = dict((box, r) for (r, box) in enumerate(boxes))
+        return BoxAssignment(rows, Assignment([level.push_cost[box[0] + box[1] * level.width] for box in boxes]))
+
+    def moved(self, old_box, new_box, level):
+        '''The assignment after pushing old_box to new_box: only that row is matched again'''
+        rows = dict(self.rows)
+        row = rows.pop(old_box)
+        rows[new_box] = row
+        return BoxAssignment(rows, self.assignment.update(row, level.push_cost[new_box[0] + new_box[1] * level.width]))
+
+    def total(self):
+        return self.assignment.total()
+
+
+# INCREMENTAL EVALUATION
+# The box terms of heur_alternate are kept per state. A box's term only depends on the level and on the boxes next to
+# it, so after a push only the pushed box and the boxes around its old and new squares have to be evaluated again.
+
+class Deadlock(float):
+    '''math.inf, tagged with the rule of heur_alternate that found the state unsolvable (see SearchProfiler)'''
+
+    def __new__(cls, rule):
+        value = float.__new__(cls, math.inf)
+        value.rule = rule
+        return value
+
+    def __repr__(self):
+        return 'Deadlock(%r)' % self.rule
+
+
+TOO_FEW_STORAGES = Deadlock('fewer storages than boxes')
+DEAD_SQUARE = Deadlock('dead square')
+FROZEN_ROW = Deadlock('boxes side by side between obstacles')
+FROZEN_COLUMN = Deadlock('boxes on top of each other between obstacles')
+SIDE_WALL_BOXES = Deadlock('boxes next to each other along the left or right wall')
+END_WALL_BOXES = Deadlock('boxes next to each other along the up or down wall')
+WALL_STORAGES = Deadlock('fewer storages than boxes along a wall')
+NO_MATCHING = Deadlock('boxes cannot all reach distinct storages')
+
+
+def box_contribution(box, boxes, level):
+    '''Penalty of a box that is not on a storage, a Deadlock (math.inf) if the box makes the state unsolvable'''
+    obstacle_and_wall = level.obstacle_and_wall
+
+    # Base case: if no storage can be reached from the square of the box (corners, boxes blocked in two
+    # directions, boxes against a wall without storage), then the state is unsolvable
+    if level.dead[box[0] + box[1] * level.width]:
+        return DEAD_SQUARE
+
+    # Find the positions for moving the box in the four basic directions 
+    up_pos = (box[0], box[1] - 1) 
+    up_pos_bool = up_pos in obstacle_and_wall 
+    down_pos = (box[0], box[1] + 1)
+    down_pos_bool = down_pos in obstacle_and_wall 
+    left_pos = (box[0] - 1, box[1])
+    left_pos_bool = left_pos in obstacle_and_wall 
+    right_pos = (box[0] + 1, box[1])
+    right_pos_bool = right_pos in obstacle_and_wall 
+
+    # If a box is blocked by an obstacle in the y direction with the same x coordinate, then if there is a horizontal neighbour box and is also blocked
+    # in any of its y direction, then the state is unsolvable
+    if (up_pos_bool or down_pos_bool) and ((left_pos in boxes and ((left_pos[0], left_pos[1] + 1) in obstacle_and_wall or (left_pos[0], left_pos[1] - 1) in obstacle_and_wall)) or (right_pos in boxes and ((right_pos[0], right_pos[1] + 1) in obstacle_and_wall or (right_pos[0], right_pos[1] - 1) in obstacle_and_wall))):
+        return FROZEN_ROW
+    # If a box is blocked by an obstacle in the x direction with the same y coordinate, then if there is a horizontal neighbour box and is also blocked
+    # in any of its y direction, then the state is unsolvable
+    if (left_pos_bool or right_pos_bool) and ((up_pos in boxes and ((up_pos[0] - 1, up_pos[1]) in obstacle_and_wall or (up_pos[0] + 1, up_pos[1]) in obstacle_and_wall)) or (down_pos in boxes and ((down_pos[0] - 1, down_pos[1]) in obstacle_and_wall or (down_pos[0] + 1, down_pos[1]) in obstacle_and_wall))):
+        return FROZEN_COLUMN
+
+    # If box is on the left/right wall and there is a consecutive box below or above it, the the state is unsolvable
+    # (a consecutive obstacle makes a corner, which is already a dead square)
+    if (box[0] == 0 or box[0] == level.width - 1) and (down_pos in boxes or up_pos in boxes):
+        return SIDE_WALL_BOXES
+
+    # If box is on the up/down wall and there is a consecutive box below or above it, the the state is unsolvable
+    if (box[1] == 0 or box[1] == level.height - 1) and (right_pos in boxes or left_pos in boxes):
+        return END_WALL_BOXES
+
+    # penalize for crowded boxes as it might increase the number of pushes (not done along the bottom wall)
+    if box[1] == level.height - 1:
+        return 0
+    return len(set((up_pos, down_pos, left_pos, right_pos)).intersection(boxes))
+
+
+def wall_sides(box, level):
+    '''Which sides of the wall (left, right, up, down) a box is along'''
+    return (box[0] == 0, box[0] == level.width - 1, box[1] == 0, box[1] == level.height - 1)
+
+
+class AlternateTerms:
+    '''Everything heur_alternate computes from the boxes of a state (not from the robots)'''
+    __slots__ = ('contributions', 'penalty', 'blocked', 'walls', 'assignment', 'value')
+
+    def __init__(self, contributions, penalty, blocked, walls, assignment, state, level):
+        self.contributions = contributions  # box not on a storage -> its penalty, a Deadlock if deadlocked
+        self.penalty = penalty  # sum of the finite penalties
+        self.blocked = blocked  # number of deadlocked boxes
+        self.walls = walls  # number of boxes along each side of the wall
+        self.assignment = assignment  # BoxAssignment, None when MATCHING is 'greedy'
+        self.value = self._value(state, level)
+
+    @staticmethod
+    def build(state, level):
+        contributions = dict((box, box_contribution(box, state.boxes, level)) for box in state.boxes if box not in state.storage)
+        penalty = sum(c for c in contributions.values() if c != math.inf)
+        blocked = sum(1 for c in contributions.values() if c == math.inf)
+        walls = [0, 0, 0, 0]
+        for box in state.boxes:
+            for (side, along) in enumerate(wall_sides(box, level)):
+                walls[side] += along
+        if MATCHING not in ('hungarian', 'greedy'):
+            raise ValueError("unknown box matching " + repr(MATCHING))
+        assignment = BoxAssignment.build(state.boxes, level) if MATCHING == 'hungarian' else None
+        return AlternateTerms(contributions, penalty, blocked, tuple(walls), assignment, state, level)
+
+    def moved(self, old_box, new_box, state, level):
+        '''The terms of state, a child of the state of these terms where old_box was pushed to new_box'''
+        contributions = dict(self.contributions)
+        penalty, blocked = self.penalty, self.blocked
+        affected = set([new_box])
+        for (dx, dy) in _DIRECTIONS:
+            affected.add((old_box[0] + dx, old_box[1] + dy))
+            affected.add((new_box[0] + dx, new_box[1] + dy))
+        affected.discard(old_box)
+        for box in [old_box] + [box for box in affected if box in contributions]:
+            c = contributions.pop(box, None)
+            if c == math.inf:
+                blocked -= 1
+            elif c is not None:
+                penalty -= c
+        for box in affected:
+            if box in state.boxes and box not in state.storage:
+                c = box_contribution(box, state.boxes, level)
+                contributions[box] = c
+                if c == math.inf:
+                    blocked += 1
+                else:
+                    penalty += c
+        walls = tuple(n - old + new for (n, old, new) in zip(self.walls, wall_sides(old_box, level), wall_sides(new_box, level)))
+        assignment = self.assignment.moved(old_box, new_box, level) if self.assignment is not None else None
+        return AlternateTerms(contributions, penalty, blocked, walls, assignment, state, level)
+
+    def _value(self, state, level):
+        '''The box part of heur_alternate: penalties plus the box to storage distances, math.inf if unsolvable'''
+        if self.blocked:
+            return next(c for c in self.contributions.values() if c == math.inf)
+
+        # If the number of storages on a side of the wall < number of boxes on that side of the wall, then the state is unsolvable
+        for (side, boxes) in enumerate(self.walls):
+            if level.storage_on_wall[side] < boxes:
+                return WALL_STORAGES
+
+        if self.assignment is not None:
+            # Minimum cost matching of every box to a distinct storage on push distances (boxes already stored cost 0
+            # if they stay)
+            matched = self.assignment.total()
+            if matched >= _NO_PATH:
+                return NO_MATCHING
+            return self.penalty + matched
+
+        # Find the minimum push distances between boxes and storages and add it to res, each storage can only be pushed to once
+        res = self.penalty
+        storage_notassigned = set(level.storage_index[s] for s in state.storage if s not in state.boxes)
+        for box in self.contributions:
+            distances = level.push_distance[box[0] + box[1] * level.width]
+            min_distance = math.inf
+            current_used_storage = None
+            for s in storage_notassigned:
+                dist = distances[s]
+                if dist < min_distance:
+                    current_used_storage = s
+                    min_distance = dist
+            # none of the free storages can be reached from this box
+            if current_used_storage is None:
+                return NO_MATCHING
+            storage_notassigned.remove(current_used_storage)
+            res += min_distance
+        return res
+
+
+def pushed_box(parent, state):
+    '''The (old square, new square) of the box pushed from parent to state, None if both have the same boxes and
+    False if they differ otherwise'''
+    if isinstance(state, PackedSokobanState) and isinstance(parent, PackedSokobanState):
+        changed = parent.box_bits ^ state.box_bits
+        if not changed:
+            return None
+        old = parent.box_bits & changed
+        new = state.box_bits & changed
+        if old & (old - 1) or new & (new - 1) or not old or not new:
+            return False
+        return (state.level.square(old.bit_length() - 1), state.level.square(new.bit_length() - 1))
+    if parent.boxes == state.boxes:
+        return None
+    if len(parent.boxes) == len(state.boxes) and len(parent.boxes - state.boxes) == 1:
+        (old_box,) = parent.boxes - state.boxes
+        (new_box,) = state.boxes - parent.boxes
+        return (old_box, new_box)
+    return False
+
+
+# HEURISTIC TABLES
+# What the heuristics compute from the boxes of a state is not kept on the state, which would make every state of the
+# search larger, but in tables keyed by the level and the box layout. Only the expanded states get an entry: a state
+# is evaluated from the entry of its parent, and the parent's entry is made (from the grandparent's) the first time one
+# of its successors is evaluated. A table holds at most BOX_TABLE_SIZE layouts, evicting the least recently used ones.
+BOX_TABLE_SIZE = 100000
+
+class BoxTable:
+    '''Values computed from the boxes of states, per box layout'''
+
+    def __init__(self, capacity=BOX_TABLE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # (level, boxes) -> value
+
+    def get(self, state, level):
+        '''The value of the boxes of state, None if it is not in the table'''
+        key = box_key(state, level)
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, state, level, value):
+        self.entries[box_key(state, level)] = value
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def box_key(state, level):
+    '''The key of the box layout of a state'''
+    if isinstance(state, PackedSokobanState):
+        return (level, state.box_bits)
+    return (level, state.boxes)
+
+
+def box_value(table, state, level, derive):
+    '''The value of the boxes of state, computed as derive(state, value of the parent or None, level) unless it is in
+    table. Puts the value of the parent in table if it is not there yet.'''
+    value = table.get(state, level)
+    if value is not None:
+        return value
+    parent = state.parent
+    previous = None
+    if parent is not None:
+        previous = table.get(parent, level)
+        if previous is None:
+            grandparent = parent.parent
+            previous = derive(parent, table.get(grandparent, level) if grandparent is not None else None, level)
+            table.put(parent, level, previous)
+    return derive(state, previous, level)
+
+
+_alternate_terms = BoxTable()  # AlternateTerms of heur_alternate
+_manhattan_values = BoxTable()  # values of heur_manhattan_distance
+_pattern_pushes = BoxTable()  # pushes of heur_pattern_database, without the robot term
+
+
+def alternate_terms(state, level):
+    '''Return the AlternateTerms of the boxes of a state'''
+    return box_value(_alternate_terms, state, level, derive_alternate_terms)
+
+
+def derive_alternate_terms(state, previous, level):
+    '''The AlternateTerms of state from previous, those of its parent (None if unknown). A state with the same boxes
+    as its parent shares the parent's terms, and a state where one box was pushed updates them for that box only.'''
+    pushed = pushed_box(state.parent, state) if previous is not None else False
+    if pushed is None:
+        return previous
+    if pushed:
+        (old_box, new_box) = pushed
+        return previous.moved(old_box, new_box, state, level)
+    return AlternateTerms.build(state, level)
+
+
+# COMPACT STATES
+# PackedSokobanState is a drop-in alternative to SokobanState for large levels. The boxes are a bitboard (bit x + y *
+# width of an int), the robots a tuple of square indices, and the board itself lives in the shared LevelAnalysis. The
+# state hash is a zobrist key updated with two or four XORs per move, so hashing never walks the boxes.
+
+class PackedBoxes:
+    '''Read-only view of a box bitboard as a collection of (x, y) squares'''
+    __slots__ = ('bits', 'width')
+
+    def __init__(self, bits, width):
+        self.bits = bits
+        self.width = width
+
+    def __contains__(self, square):
+        (x, y) = square
+        return 0 <= x < self.width and y >= 0 and (self.bits >> (x + y * self.width)) & 1 == 1
+
+    def __iter__(self):
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            yield (index % self.width, index // self.width)
+            bits ^= low
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+
+def _zobrist_keys(level, robots):
+    '''The zobrist keys of a level: one per square for the boxes and one per square for each robot'''
+    if not hasattr(level, 'zobrist_boxes'):
+        rng = random.Random(level.width * 7919 + level.height)
+        level.zobrist_boxes = [rng.getrandbits(64) for _ in range(level.width * level.height)]
+        level.zobrist_robots = []
+    rng = random.Random(len(level.zobrist_robots))
+    while len(level.zobrist_robots) < robots:
+        level.zobrist_robots.append([rng.getrandbits(64) for _ in range(level.width * level.height)])
+    return level.zobrist_boxes, level.zobrist_robots
+
+
+class PackedSokobanState(StateSpace):
+    '''A sokoban state stored as a box bitboard and a tuple of robot squares, with an incremental zobrist hash'''
+
+    def __init__(self, action, gval, parent, level, robot_squares, box_bits, zobrist):
+        StateSpace.__init__(self, action, gval, parent)
+        self.level = level
+        self.robot_squares = robot_squares
+        self.box_bits = box_bits
+        self.zobrist = zobrist
+
+    def successors(self):
+        level = self.level
+        width, height, floor = level.width, level.height, level.floor
+        zobrist_boxes, zobrist_robots = level.zobrist_boxes, level.zobrist_robots
+        robots = self.robot_squares
+        boxes = self.box_bits
+        successors = []
+        for (index, robot) in enumerate(robots):
+            (x, y) = (robot % width, robot // width)
+            for (name, (dx, dy)) in _DIRECTION_NAMES:
+                if not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                square = robot + dx + dy * width
+                if not floor[square] or square in robots:
+                    continue
+                new_boxes = boxes
+                zobrist = self.zobrist ^ zobrist_robots[index][robot] ^ zobrist_robots[index][square]
+                if (boxes >> square) & 1:
+                    if not (0 <= x + 2 * dx < width and 0 <= y + 2 * dy < height):
+                        continue
+                    box_square = square + dx + dy * width
+                    if not floor[box_square] or (boxes >> box_square) & 1 or box_square in robots:
+                        continue
+                    new_boxes = boxes ^ (1 << square) ^ (1 << box_square)
+                    zobrist ^= zobrist_boxes[square] ^ zobrist_boxes[box_square]
+                new_robots = robots[:index] + (square,) + robots[index + 1:]
+                successors.append(PackedSokobanState(str(index) + " " + name, self.gval + 1, self, level, new_robots,
+                                                     new_boxes, zobrist))
+        return successors
+
+    def hashable_state(self):
+        return self.zobrist
+
+    # the SokobanState interface, decoded on demand
+    @property
+    def boxes(self):
+        return PackedBoxes(self.box_bits, self.level.width)
+
+    @property
+    def robots(self):
+        return tuple(self.level.square(r) for r in self.robot_squares)
+
+    @property
+    def storage(self):
+        return self.level.storage_set
+
+    @property
+    def obstacles(self):
+        return self.level.obstacles
+
+    @property
+    def width(self):
+        return self.level.width
+
+    @property
+    def height(self):
+        return self.level.height
+
+    def state_string(self):
+        return unpack_state(self).state_string()
+
+    def print_state(self):
+        print(self.state_string())
+
+
+_DIRECTION_NAMES = (('up', (0, -1)), ('right', (1, 0)), ('down', (0, 1)), ('left', (-1, 0)))
+
+
+def pack_state(state):
+    '''The PackedSokobanState of a SokobanState (without its parent)'''
+    level = analyze_level(state)
+    zobrist_boxes, zobrist_robots = _zobrist_keys(level, len(state.robots))
+    box_bits = 0
+    zobrist = 0
+    for box in state.boxes:
+        square = box[0] + box[1] * level.width
+        box_bits |= 1 << square
+        zobrist ^= zobrist_boxes[square]
+    robots = tuple(r[0] + r[1] * level.width for r in state.robots)
+    for (index, robot) in enumerate(robots):
+        zobrist ^= zobrist_robots[index][robot]
+    return PackedSokobanState(state.action, state.gval, None, level, robots, box_bits, zobrist)
+
+
+def unpack_state(state):
+    '''The SokobanState of a PackedSokobanState, with its whole path unpacked as well'''
+    path = []
+    while state:
+        path.append(state)
+        state = state.parent
+    parent = None
+    for packed in reversed(path):
+        parent = SokobanState(packed.action, packed.gval, parent, packed.width, packed.height, packed.robots,
+                              frozenset(packed.boxes), packed.storage, packed.obstacles)
+    return parent
+
+
+def packed_goal_state(state):
+    '''Goal test of a PackedSokobanState: every box is on a storage'''
+    return state.box_bits & ~state.level.storage_mask == 0
+
+
+def goal_function(state):
+    '''The goal test to search from state with'''
+    if isinstance(state, PackedSokobanState):
+        return packed_goal_state
+    return sokoban_goal_state
+
+
+# PATTERN DATABASE
+# For a group of k boxes, the pattern database holds the exact number of pushes that brings the group onto any k
+# storages, ignoring the other boxes and where the robot can walk. Both are relaxations, so the sum over disjoint
+# groups never exceeds the pushes of the whole level. The tables are made once per level by a backward breadth first
+# search of pulls from every placement of the group on storages, saved to disk, and read through mmap afterwards.
+PDB_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb')
+PDB_PATTERN_SIZE = 2
+
+_PDB_MAGIC = b'SOKPDB'
+_PDB_HEADER = struct.Struct('<6sHHHHH20s')  # magic, version, width, height, pattern size, live squares, fingerprint
+_PDB_VERSION = 1
+_PDB_UNSOLVABLE = 255  # entry of a group that can never be stored (values are capped just below)
+
+
+def level_fingerprint(level):
+    '''SHA-1 of the layout of a level (size, obstacles and storages)'''
+    layout = repr((level.width, level.height, sorted(level.obstacles), level.storage))
+    return hashlib.sha1(layout.encode()).digest()
+
+
+class PatternDatabase:
+    '''Push costs of every group of 1 to size boxes placed on squares that are not dead. A group is ranked with the
+    combinatorial number system over the live squares, and each group size has one byte per rank.'''
+
+    def __init__(self, size, width, height, live, tables, fingerprint):
+        self.size = size
+        self.width = width
+        self.height = height
+        self.live = live  # live squares, in increasing order
+        self.tables = tables  # tables[s - 1] supports tables[s - 1][rank] -> pushes (bytes, bytearray or a memoryview)
+        self.fingerprint = fingerprint
+        self.rank_of = dict((square, r) for (r, square) in enumerate(live))
+        # binomial[s][n] = C(n, s)
+        self.binomial = [[math.comb(n, s) for n in range(len(live) + 1)] for s in range(size + 1)]
+
+    def rank(self, ranks):
+        '''Rank of a group, given as the increasing ranks of its squares among the live squares'''
+        binomial = self.binomial
+        return sum(binomial[i + 1][r] for (i, r) in enumerate(ranks))
+
+    def lookup(self, squares):
+        '''Pushes needed by a group of at most size boxes (square indices in increasing order), math.inf if the group
+        can never be stored'''
+        rank_of = self.rank_of
+        ranks = []
+        for square in squares:
+            r = rank_of.get(square)
+            if r is None:
+                return math.inf
+            ranks.append(r)
+        value = self.tables[len(ranks) - 1][self.rank(ranks)]
+        return math.inf if value == _PDB_UNSOLVABLE else value
+
+    @staticmethod
+    def build(level, size=PDB_PATTERN_SIZE):
+        '''Compute the database of a level by retrograde breadth first search'''
+        width = level.width
+        live = [square for square in range(width * level.height) if not level.dead[square]]
+        pdb = PatternDatabase(size, width, level.height, live, [], level_fingerprint(level))
+        storage = sorted(pdb.rank_of[s[0] + s[1] * width] for s in level.storage)
+        for group_size in range(1, size + 1):
+            table = bytearray([_PDB_UNSOLVABLE]) * math.comb(len(live), group_size)
+            frontier = []
+            for group in _combinations(storage, group_size):
+                table[pdb.rank(group)] = 0
+                frontier.append(group)
+            pushes = 0
+            while frontier:
+                pushes += 1
+                next_frontier = []
+                for group in frontier:
+                    squares = [live[r] for r in group]
+                    for (i, square) in enumerate(squares):
+                        (x, y) = (square % width, square // width)
+                        for (dx, dy) in _DIRECTIONS:
+                            # pull the box from square to square + d, the robot stepping back to square + 2d
+                            if not (level.is_floor(x + dx, y + dy) and level.is_floor(x + 2 * dx, y + 2 * dy)):
+                                continue
+                            pulled = square + dx + dy * width
+                            robot = pulled + dx + dy * width
+                            if pulled in squares or robot in squares or pulled not in pdb.rank_of:
+                                continue
+                            new_group = sorted(group[:i] + group[i + 1:] + (pdb.rank_of[pulled],))
+                            r = pdb.rank(new_group)
+                            if table[r] == _PDB_UNSOLVABLE:
+                                table[r] = min(pushes, _PDB_UNSOLVABLE - 1)
+                                next_frontier.append(tuple(new_group))
+                frontier = next_frontier
+            pdb.tables.append(table)
+        return pdb
+
+    def save(self, path):
+        '''Write the database: header, live squares (unsigned 16 bit) and one byte per group of each size'''
+        with open(path, 'wb') as f:
+            f.write(_PDB_HEADER.pack(_PDB_MAGIC, _PDB_VERSION, self.width, self.height, self.size, len(self.live),
+                                     self.fingerprint))
+            f.write(struct.pack('<%dH' % len(self.live), *self.live))
+            for table in self.tables:
+                f.write(table)
+
+    @staticmethod
+    def load(path):
+        '''Map a database file into memory, the tables are read from the mapping without being copied'''
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, width, height, size, count, fingerprint) = _PDB_HEADER.unpack_from(mapping, 0)
+        if magic != _PDB_MAGIC or version != _PDB_VERSION:
+            raise ValueError(path + " is not a pattern database")
+        offset = _PDB_HEADER.size
+        live = list(struct.unpack_from('<%dH' % count, mapping, offset))
+        offset += 2 * count
+        view = memoryview(mapping)
+        tables = []
+        for group_size in range(1, size + 1):
+            length = math.comb(count, group_size)
+            tables.append(view[offset:offset + length])
+            offset += length
+        return PatternDatabase(size, width, height, live, tables, fingerprint)
+
+
+def _combinations(items, k):
+    '''All increasing k-tuples of items'''
+    if k == 0:
+        yield ()
+        return
+    for i in range(len(items) - k + 1):
+        for rest in _combinations(items[i + 1:], k - 1):
+            yield (items[i],) + rest
+
+
+def pattern_database_path(level, size=None, directory=None):
+    '''Where the pattern database of a level is saved (default: PDB_DIRECTORY, PDB_PATTERN_SIZE)'''
+    return os.path.join(directory or PDB_DIRECTORY, '%s-%d.pdb' % (level_fingerprint(level).hex(), size or PDB_PATTERN_SIZE))
+
+
+def build_pattern_database(state, size=None, directory=None):
+    '''Build the pattern database of the level of a sokoban state and save it (offline precomputation)'''
+    level = analyze_level(state)
+    path = pattern_database_path(level, size, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    PatternDatabase.build(level, size or PDB_PATTERN_SIZE).save(path)
+    return path
+
+
+def pattern_database(level, size=None, directory=None):
+    '''The pattern database of a level, mapped from disk, or None if build_pattern_database was not run for it. The
+    database is never built here, as that would happen in the middle of a timed search.'''
+    size = size or PDB_PATTERN_SIZE
+    databases = level.__dict__.setdefault('pattern_databases', {})
+    if size not in databases:
+        path = pattern_database_path(level, size, directory)
+        databases[size] = PatternDatabase.load(path) if os.path.exists(path) else None
+    return databases[size]
+
+
+# MACRO MOVES
+# With macro moves a successor is a whole push: the robot walks along a shortest path to a square next to a box and
+# pushes it. When the box is pushed into a tunnel (the box ends up between two walls and the square past it is free),
+# it keeps being pushed until it leaves the tunnel or reaches a storage, as stopping halfway is never useful.
+# gval still counts every single step, so costs are the same as with unit moves and fval_function is unchanged.
+
+class MacroSokobanState(SokobanState):
+    '''A SokobanState whose successors are pushes, reached through walks of the robot. The action of a successor is
+    the robot index followed by the direction names of all its steps, separated by commas.'''
+
+    def successors(self):
+        level = analyze_level(self)
+        boxes = self.boxes
+        successors = []
+        for (index, robot) in enumerate(self.robots):
+            others = set(self.robots[:index] + self.robots[index + 1:])
+            # breadth first search of the squares the robot can walk to
+            came_from = {robot: None}
+            queue = deque([robot])
+            while queue:
+                square = queue.popleft()
+                for (name, (dx, dy)) in _DIRECTION_NAMES:
+                    walk_to = (square[0] + dx, square[1] + dy)
+                    if walk_to in came_from or not level.is_floor(*walk_to) or walk_to in boxes or walk_to in others:
+                        continue
+                    came_from[walk_to] = (square, name)
+                    queue.append(walk_to)
+
+            for square in came_from:
+                for (name, (dx, dy)) in _DIRECTION_NAMES:
+                    box = (square[0] + dx, square[1] + dy)
+                    if box not in boxes:
+                        continue
+                    steps = _walk(came_from, square)
+                    (robot_at, box_at) = (square, box)
+                    while True:
+                        target = (box_at[0] + dx, box_at[1] + dy)
+                        if not level.is_floor(*target) or target in boxes or target in others:
+                            break
+                        (robot_at, box_at) = (box_at, target)
+                        steps.append(name)
+                        if box_at in self.storage or not _in_tunnel(level, box_at, dx, dy):
+                            break
+                    if robot_at == square:
+                        continue  # the box cannot be pushed
+                    new_boxes = set(boxes)
+                    new_boxes.remove(box)
+                    new_boxes.add(box_at)
+                    new_robots = self.robots[:index] + (robot_at,) + self.robots[index + 1:]
+                    successors.append(MacroSokobanState(str(index) + " " + ",".join(steps), self.gval + len(steps), self,
+                                                        self.width, self.height, new_robots, frozenset(new_boxes),
+                                                        self.storage, self.obstacles))
+        return successors
+
+
+def _walk(came_from, square):
+    '''Direction names of the shortest walk that reaches square in a breadth first search tree'''
+    steps = []
+    while came_from[square] is not None:
+        (square, name) = came_from[square]
+        steps.append(name)
+    steps.reverse()
+    return steps
+
+
+def _in_tunnel(level, box, dx, dy):
+    '''True if the box, pushed in direction (dx, dy), is between two walls or obstacles'''
+    return not level.is_floor(box[0] + dy, box[1] + dx) and not level.is_floor(box[0] - dy, box[1] - dx)
+
+
+def macro_state(state):
+    '''The MacroSokobanState of a SokobanState, to search with macro moves'''
+    return MacroSokobanState(state.action, state.gval, state.parent, state.width, state.height, state.robots,
+                             state.boxes, state.storage, state.obstacles)
+
+
+def expand_macro_path(state):
+    '''Replay the path to a MacroSokobanState one step at a time, returning the equivalent SokobanState'''
+    path = []
+    while state is not None and isinstance(state, MacroSokobanState):
+        path.append(state)
+        state = state.parent
+    path.reverse()
+    first = path[0]
+    current = SokobanState(first.action, first.gval, first.parent, first.width, first.height, first.robots,
+                           first.boxes, first.storage, first.obstacles)
+    moves = dict(_DIRECTION_NAMES)
+    for macro in path[1:]:
+        (index, names) = macro.action.split(" ")
+        index = int(index)
+        for name in names.split(","):
+            robot = current.robots[index]
+            (dx, dy) = moves[name]
+            robots = current.robots[:index] + ((robot[0] + dx, robot[1] + dy),) + current.robots[index + 1:]
+            current = next(s for s in SokobanState.successors(current) if s.robots == robots)
+    return current
+
+
 def heur_zero(state):
     '''Zero Heuristic can be used to make A* search perform uniform cost search'''
     return 0
@@ -205,16 +1059,65 @@ def heur_manhattan_distance(state):
     # When calculating distances, assume there are no obstacles on the grid.
     # You should implement this heuristic function exactly, even if it is tempting to improve it.
     # Your function should return a numeric value; this is the estimate of the distance to the goal.
+    # The distance from every square to its nearest storage is precomputed per level (0 on a storage), and the value
+    # is kept per box layout (see BoxTable): a child that pushed one box only swaps the term of that box in the value
+    # of its parent.
+    return box_value(_manhattan_values, state, analyze_level(state), derive_manhattan_distance)
+
+
+def derive_manhattan_distance(state, previous, level):
+    '''The value of heur_manhattan_distance for state from previous, the value of its parent (None if unknown)'''
+    nearest = level.nearest_storage
+    width = level.width
+    pushed = pushed_box(state.parent, state) if previous is not None else False
+    if pushed is None:
+        return previous
+    if pushed:
+        (old_box, new_box) = pushed
+        return previous - nearest[old_box[0] + old_box[1] * width] + nearest[new_box[0] + new_box[1] * width]
     val = 0
     for box in state.boxes:
-        if box not in state.storage:
-            dist = []
-            for s in state.storage:
-                dist.append(abs(box[0] - s[0]) + abs(box[1] - s[1]))
-            val += min(dist)
+        val += nearest[box[0] + box[1] * width]
     return val
           
 
+def heur_pattern_database(state):
+    '''admissible sokoban heuristic from the pattern database of the level'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+    # The boxes are split into groups of PDB_PATTERN_SIZE in square order (boxes close on the board often end up in the
+    # same group) and the exact pushes of each group are added. The minimum cost matching of boxes to storages is also
+    # a lower bound on the pushes, so the larger of the two is used. Before its first push the robot has to walk next to
+    # a box, which adds the distance from the robot to the nearest box that is not stored, minus one.
+    # The pushes only depend on the boxes and are kept per box layout in _pattern_pushes. Without a database of the
+    # level (see build_pattern_database) only the matching is used.
+    level = analyze_level(state)
+    pushes = _pattern_pushes.get(state, level)
+    if pushes is None:
+        pushes = pattern_pushes(state, level)
+        _pattern_pushes.put(state, level, pushes)
+    if pushes != math.inf and pushes > 0:
+        pushes += min(abs(robot[0] - box[0]) + abs(robot[1] - box[1])
+                      for robot in state.robots for box in state.boxes if box not in state.storage) - 1
+    return pushes
+
+
+def pattern_pushes(state, level):
+    '''Lower bound on the pushes left for the boxes of a state: the pattern database lookups or the matching'''
+    matched = BoxAssignment.build(state.boxes, level).total()
+    if matched >= _NO_PATH:
+        return math.inf
+    pdb = pattern_database(level)
+    if pdb is None:
+        return matched
+    width = level.width
+    squares = sorted(box[0] + box[1] * width for box in state.boxes)
+    pushes = 0
+    for i in range(0, len(squares), pdb.size):
+        pushes += pdb.lookup(squares[i:i + pdb.size])
+    return max(pushes, matched)
+
+
 def fval_function(sN, weight):
     # IMPLEMENT
     """
@@ -227,88 +1130,807 @@ def fval_function(sN, weight):
     """
     return sN.gval + weight * sN.hval
 
+# TRANSPOSITION TABLE
+# The anytime searches restart from the initial state in every round. The table keeps, for every state seen in the run,
+# its heuristic value and the cheapest g-value it was reached with, so later rounds neither recompute heuristics nor
+# expand states through paths that are already known to be more expensive.
+TRANSPOSITION_TABLE_SIZE = 500000
+
+# Cost bound on h that only prunes states whose heuristic is math.inf (dead ends, or dominated in the table)
+_HVAL_BOUND = sys.float_info.max
+
+class TranspositionTable:
+    '''Heuristic values and best known g-values per state hash, shared by all the rounds of one anytime search.
+    Holds at most capacity states, evicting the least recently used ones.'''
+
+    def __init__(self, capacity=TRANSPOSITION_TABLE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # state hash -> (hval, best gval)
+        self.hits = 0
+        self.pruned = 0
+
+    def heuristic(self, heur_fn):
+        '''Wrap heur_fn so that it answers from the table. A state reached with a larger g-value than the best known
+        one gets math.inf, which the cost bound of the search prunes: the cheaper path to it is still searched.'''
+        entries = self.entries
+
+        def cached_heur_fn(state):
+            key = state.hashable_state()
+            entry = entries.get(key)
+            if entry is None:
+                hval = heur_fn(state)
+                entries[key] = (hval, state.gval)
+                if len(entries) > self.capacity:
+                    entries.popitem(last=False)
+                return hval
+            entries.move_to_end(key)
+            self.hits += 1
+            if state.gval > entry[1]:
+                self.pruned += 1
+                return math.inf
+            if state.gval < entry[1]:
+                entries[key] = (entry[0], state.gval)
+            return entry[0]
+
+        return cached_heur_fn
+
+
+def anytime_heuristic(heur_fn, budget, bound=None):
+    '''The heuristic of the rounds of an anytime search: heur_fn answered from a TranspositionTable that survives from
+    one round to the next, then bound(heuristic) if bound is given (see bounded_heuristic), then math.inf once budget is
+    spent. Only the values of heur_fn go into the table, never what the bound makes of them.'''
+    heur_fn = TranspositionTable().heuristic(heur_fn)
+    if bound is not None:
+        heur_fn = bound(heur_fn)
+    return budget.heuristic(heur_fn)
+
+
+# INSTRUMENTATION
+# A SearchProfiler passed to the searches wraps their heuristic and goal test (the goal test runs once per expanded
+# state) and writes what it sees as a stream of events, plain dictionaries with a 'type' and the seconds since the
+# profiler was created:
+#   progress   every sample_every expansions: expansions, expansions per second, size of the open list
+#   round      after each round of an anytime search: algorithm, round, weight, seconds, expansions, solution cost
+#   summary    from summary(): calls and seconds per heuristic, and how often each deadlock rule returned math.inf
+# Events go to sink(event) if a sink is given, else to the events list, which to_csv and to_folded export.
+
+class SearchProfiler:
+    '''Collects heuristic, deadlock, expansion and round statistics of searches as a stream of events'''
+
+    def __init__(self, sink=None, sample_every=1000):
+        self.sink = sink
+        self.sample_every = sample_every
+        self.events = []
+        self.start = time.perf_counter()
+        self.heuristic_calls = {}  # heuristic name -> number of calls
+        self.heuristic_seconds = {}  # heuristic name -> total seconds
+        self.deadlocks = {}  # deadlock rule -> number of math.inf returned because of it
+        self.expansions = 0
+        self.search_seconds = 0.0  # total time of the searches that reported rounds
+        self._sample_start = (self.start, 0)
+
+    def emit(self, event_type, **fields):
+        event = dict(type=event_type, time=round(time.perf_counter() - self.start, 6), **fields)
+        if self.sink is not None:
+            self.sink(event)
+        else:
+            self.events.append(event)
+
+    def heuristic(self, heur_fn):
+        '''Wrap heur_fn to count its calls and time, and the deadlock rules behind its infinite values'''
+        name = getattr(heur_fn, '__name__', 'heuristic')
+        self.heuristic_calls.setdefault(name, 0)
+        self.heuristic_seconds.setdefault(name, 0.0)
+
+        def profiled_heur_fn(state):
+            started = time.perf_counter()
+            hval = heur_fn(state)
+            self.heuristic_seconds[name] += time.perf_counter() - started
+            self.heuristic_calls[name] += 1
+            if hval == math.inf:
+                rule = getattr(hval, 'rule', 'other')
+                self.deadlocks[rule] = self.deadlocks.get(rule, 0) + 1
+            return hval
+
+        return profiled_heur_fn
+
+    def goal(self, goal_fn, open_size=None):
+        '''Wrap goal_fn to count expansions, with open_size() giving the size of the open list (or None)'''
+        def profiled_goal_fn(state):
+            self.expansions += 1
+            if self.expansions % self.sample_every == 0:
+                now = time.perf_counter()
+                (since, expanded) = self._sample_start
+                self._sample_start = (now, self.expansions)
+                self.emit('progress', expansions=self.expansions,
+                          expansions_per_second=round((self.expansions - expanded) / max(now - since, 1e-9), 1),
+                          open=open_size() if open_size is not None else None)
+            return goal_fn(state)
+
+        return profiled_goal_fn
+
+    def round(self, algorithm, number, weight, started, expansions, cost):
+        '''Report a round of a search that started at time.perf_counter() == started'''
+        seconds = time.perf_counter() - started
+        self.search_seconds += seconds
+        self.emit('round', algorithm=algorithm, round=number, weight=weight, seconds=round(seconds, 6),
+                  expansions=expansions, cost=cost)
+
+    def summary(self):
+        '''Emit and return the totals collected so far'''
+        fields = dict(expansions=self.expansions, heuristic_calls=dict(self.heuristic_calls),
+                      heuristic_seconds=dict((k, round(v, 6)) for (k, v) in self.heuristic_seconds.items()),
+                      deadlocks=dict(self.deadlocks))
+        self.emit('summary', **fields)
+        return fields
+
+    def to_csv(self, path):
+        '''Write the collected events as CSV, one row per event and one column per field'''
+        columns = []
+        for event in self.events:
+            columns.extend(k for k in event if k not in columns)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(self.events)
+
+    def to_folded(self, path):
+        '''Write the time split in the folded stack format of flamegraph.pl (microseconds per stack)'''
+        total = self.search_seconds or (time.perf_counter() - self.start)
+        in_heuristics = sum(self.heuristic_seconds.values())
+        with open(path, 'w') as f:
+            for (name, seconds) in sorted(self.heuristic_seconds.items()):
+                f.write('search;%s %d\n' % (name, seconds * 1e6))
+            f.write('search;expand %d\n' % (max(total - in_heuristics, 0) * 1e6))
+
+
+def _open_size(se):
+    '''Size of the open list of a SearchEngine, None if it cannot be seen'''
+    try:
+        return len(se.open.open)
+    except (AttributeError, TypeError):
+        return None
+
+
+# BUDGETS
+# The anytime searches run under a Budget, which can limit wall clock seconds, cpu seconds of this process, expanded
+# states and peak memory, and can be cancelled from outside (cancel(), or a threading or multiprocessing Event). The
+# searches count their expansions through the budget's goal test and check its clocks every BUDGET_CHECK_EVERY
+# expansions. Once the budget is spent its heuristic wrapper returns math.inf for every state, so the search engine
+# prunes all successors, drains its open list and returns.
+# Before every round the budget gives the round a slice of what is left. The expansions of the next round are predicted
+# from the growth of the previous ones; a round that is not expected to finish in what is left is not started.
+BUDGET_CHECK_EVERY = 64
+ROUND_GROWTH = 2  # predicted growth of the expansions from one round to the next, until two rounds are known
+ROUND_GROWTH_LIMIT = 8
+ROUND_SLACK = 1.5  # a round's slice is at least this many times its predicted duration
+
+class Budget:
+    '''Limits of one search: wall and cpu are seconds, nodes is a number of expanded states and memory_mb the peak
+    resident memory of the process. A round may use at most round_share of what is left, or its predicted duration
+    times ROUND_SLACK if that is more.'''
+
+    def __init__(self, wall=None, cpu=None, nodes=None, memory_mb=None, cancel_event=None, round_share=1.0):
+        self.wall = wall
+        self.cpu = cpu
+        self.nodes = nodes
+        self.memory_mb = memory_mb
+        self.cancel_event = cancel_event
+        self.round_share = round_share
+        self.start_wall = time.monotonic()
+        self.start_cpu = time.process_time()
+        self.expansions = 0
+        self.stopped = None  # why the budget is spent ('wall', 'cpu', 'nodes', 'memory' or 'cancelled'), else None
+        self.round_stopped = False
+        self.round_deadline = math.inf
+        self.rounds = []  # (expansions, seconds) of every finished round
+        self._round_start = None
+
+    def cancel(self, reason='cancelled'):
+        self.stopped = reason
+
+    def elapsed(self):
+        return time.monotonic() - self.start_wall
+
+    def remaining(self):
+        '''Seconds left by the wall and cpu limits, math.inf without either'''
+        left = math.inf
+        if self.wall is not None:
+            left = min(left, self.wall - self.elapsed())
+        if self.cpu is not None:
+            left = min(left, self.cpu - (time.process_time() - self.start_cpu))
+        return max(left, 0)
+
+    def check(self):
+        '''Look at the clocks, memory and cancel event. Returns True if the search (or its round) must stop.'''
+        if self.stopped is None:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.stopped = 'cancelled'
+            elif self.wall is not None and self.elapsed() >= self.wall:
+                self.stopped = 'wall'
+            elif self.cpu is not None and time.process_time() - self.start_cpu >= self.cpu:
+                self.stopped = 'cpu'
+            elif self.memory_mb is not None and resource is not None and \
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 >= self.memory_mb:  # kilobytes on Linux
+                self.stopped = 'memory'
+            elif time.monotonic() >= self.round_deadline:
+                self.round_stopped = True
+        return self.stopped is not None or self.round_stopped
+
+    def expand(self):
+        '''Count an expansion. Returns True if the search (or its round) must stop.'''
+        if self.stopped is not None or self.round_stopped:
+            return True  # the search engine is draining its open list
+        self.expansions += 1
+        if self.nodes is not None and self.expansions >= self.nodes:
+            self.stopped = 'nodes'
+        elif self.expansions % BUDGET_CHECK_EVERY == 0:
+            self.check()
+        return self.stopped is not None or self.round_stopped
+
+    def goal(self, goal_fn):
+        '''Wrap goal_fn to count an expansion for every state the search engine takes from its open list'''
+        def budgeted_goal_fn(state):
+            self.expand()
+            return goal_fn(state)
+
+        return budgeted_goal_fn
+
+    def heuristic(self, heur_fn):
+        '''Wrap heur_fn to return math.inf once the search (or its round) must stop'''
+        def budgeted_heur_fn(state):
+            if self.stopped is not None or self.round_stopped:
+                return math.inf
+            return heur_fn(state)
+
+        return budgeted_heur_fn
+
+    def predict_round(self):
+        '''Predicted seconds of the next round, 0 before the first one'''
+        if not self.rounds:
+            return 0
+        growth = ROUND_GROWTH
+        if len(self.rounds) > 1 and self.rounds[-2][0] > 0:
+            growth = min(max(self.rounds[-1][0] / self.rounds[-2][0], 1), ROUND_GROWTH_LIMIT)
+        expansions = sum(e for (e, s) in self.rounds)
+        seconds = sum(s for (e, s) in self.rounds)
+        return self.rounds[-1][0] * growth * seconds / max(expansions, 1)
+
+    def next_round(self):
+        '''Start a round. Returns its slice in seconds (math.inf without time limits), 0 if it should not start.'''
+        if self.check():
+            return 0
+        left = self.remaining()
+        predicted = self.predict_round()
+        if predicted > left:
+            return 0
+        seconds = min(left, max(predicted * ROUND_SLACK, left * self.round_share))
+        now = time.monotonic()
+        self.round_stopped = False
+        self.round_deadline = now + seconds
+        self._round_start = (now, self.expansions)
+        return seconds
+
+    def end_round(self):
+        '''End the round started by next_round. Returns True if the round ran out of its slice before the budget was
+        spent: it was cut short, and the search may go on with another round.'''
+        (started, expansions) = self._round_start
+        now = time.monotonic()
+        self.rounds.append((self.expansions - expansions, now - started))
+        cut = self.stopped is None and (self.round_stopped or now >= self.round_deadline)
+        self.round_stopped = False
+        self.round_deadline = math.inf
+        return cut
+
+
 # SEARCH ALGORITHMS
-def weighted_astar(initial_state, heur_fn, weight, timebound):
+def weighted_astar(initial_state, heur_fn, weight, timebound, macro=False, profiler=None):
     # IMPLEMENT    
     '''Provides an implementation of weighted a-star, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds), whether to
+    search with macro moves (the goal state then has macro actions, see expand_macro_path) and an optional
+    SearchProfiler'''
     '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
     '''implementation of weighted astar algorithm'''
+    if macro:
+        initial_state = macro_state(initial_state)
     se = SearchEngine('custom', 'full')
+    goal_fn = goal_function(initial_state)
+    if profiler is not None:
+        heur_fn = profiler.heuristic(heur_fn)
+        goal_fn = profiler.goal(goal_fn, lambda: _open_size(se))
+        started = time.perf_counter()
     wrapped_fval_function = (lambda sN: fval_function(sN, weight))     
-    se.init_search(initial_state, sokoban_goal_state, heur_fn, wrapped_fval_function)     
-    final, stats = se.search(timebound)     
+    se.init_search(initial_state, goal_fn, heur_fn, wrapped_fval_function)     
+    final, stats = se.search(timebound, (float('inf'), _HVAL_BOUND, float('inf')))
+    if profiler is not None:
+        profiler.round('weighted_astar', 1, weight, started, stats.states_expanded, final.gval if final else None)
     return final, stats
 
-def iterative_astar(initial_state, heur_fn, weight=1, timebound=5):  # uses f(n), see how autograder initializes a search line 88
+def iterative_astar(initial_state, heur_fn, weight=1, timebound=5, on_solution=None, profiler=None, budget=None,
+                    bound=None):  # uses f(n), see how autograder initializes a search line 88
     # IMPLEMENT
     '''Provides an implementation of realtime a-star, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state and a timebound (number of wall clock seconds),
+    optionally a function called as on_solution(state, weight) every time a better solution is found, a SearchProfiler,
+    a Budget to run under instead of the timebound and a bound on the heuristic (see anytime_heuristic)'''
     '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
     '''implementation of iterative astar algorithm'''
-    start_time = os.times()[0]
+    if budget is None:
+        budget = Budget(wall=timebound)
     best_soln = None
     best_cost = float('inf')
     best_stats = None
     
     current_weight = weight
+    goal_fn = budget.goal(goal_function(initial_state))
+    if profiler is not None:
+        heur_fn = profiler.heuristic(heur_fn)
+    # heuristic values and best g-values survive from one round to the next
+    heur_fn = anytime_heuristic(heur_fn, budget, bound)
+    rounds = 0
     
     while True:
-        used_time = os.times()[0] - start_time
-        remain = timebound - used_time
+        remain = budget.next_round()
         if remain <= 0:
             break
         
         wrapped_fval = (lambda sN: fval_function(sN, current_weight))
         se = SearchEngine(strategy='custom', cc_level='full')
-        se.init_search(initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=wrapped_fval)
+        round_goal_fn = goal_fn
+        if profiler is not None:
+            round_goal_fn = profiler.goal(goal_fn, lambda: _open_size(se))
+            started = time.perf_counter()
+        se.init_search(initial_state, goal_fn=round_goal_fn, heur_fn=heur_fn, fval_function=wrapped_fval)
 
-        costbound = (float('inf'), float('inf'), best_cost)
+        costbound = (float('inf'), _HVAL_BOUND, best_cost)
 
         result, stats = se.search(timebound=remain, costbound=costbound)
+        cut = budget.end_round()
+        rounds += 1
+        if profiler is not None:
+            profiler.round('iterative_astar', rounds, current_weight, started, stats.states_expanded,
+                           result.gval if result else None)
 
         if not result:
+            if cut or _open_size(se):
+                # cut short by its slice (or the engine's clock): the next round gets a longer one, with the same weight
+                continue
             break
 
         if result.gval < best_cost:
             best_soln = result
             best_cost = result.gval
             best_stats = stats
+            if on_solution is not None:
+                on_solution(result, current_weight)
 
         current_weight = max(current_weight * 0.6, 1)
         # current_weight *= 0.6
 
     return best_soln, best_stats
 
-def iterative_gbfs(initial_state, heur_fn, timebound=5):  # only use h(n)
+# Bidirectional search: at most this many states are kept from the backward search, and at most this many placements
+# of the boxes on storages are used as its starting points. The two searches take turns: the backward one grows by
+# batches of BACKWARD_BATCH states after every BIDIRECTIONAL_BATCH forward expansions.
+BACKWARD_STATES = 2000000
+BACKWARD_GOAL_PLACEMENTS = 100
+BACKWARD_BATCH = 500
+BIDIRECTIONAL_BATCH = 100
+
+def bidirectional_search(initial_state, heur_fn, weight=1, timebound=5, backward_share=0.5, budget=None):
+    '''Provides an implementation of bidirectional (meet in the middle) weighted a-star'''
+    '''INPUT: a sokoban state that represents the start state, the weight and a timebound (number of wall clock
+    seconds), the share of the search time spent on the backward search and a Budget to run under instead of the
+    timebound'''
+    '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object (of the forward search)'''
+    '''A forward weighted a-star runs with the usual goal test and heuristic, and takes turns with a breadth first
+    search running backwards from the goal: from every placement of the boxes on storages with the robot anywhere, it
+    applies reversed moves (the robot steps back, pulling the box it had pushed). After every batch of forward
+    expansions the backward search grows until it has had backward_share of the time. The searches meet when the
+    forward search expands a state the backward search reached, or when the backward search reaches a state the
+    forward search generated before. The path is completed with the backward moves, replayed through successors().
+    Backward states are known exactly, so their heuristic is their backward distance. Only single robot levels are
+    searched backwards, others get a plain weighted a-star.'''
+    if budget is None:
+        budget = Budget(wall=timebound)
+    goal_fn = goal_function(initial_state)
+    if type(initial_state) is not SokobanState or len(initial_state.robots) != 1:
+        return weighted_astar(initial_state, heur_fn, weight, budget.remaining())
+
+    backward = {}  # (robot, boxes) -> (next (robot, boxes) towards the goal or None, distance to the goal)
+    growing = _backward_search(initial_state, analyze_level(initial_state), backward, budget)
+    forward = {}  # (robot, boxes) -> the cheapest state the forward search generated with them
+    met = []  # forward states reached by the backward search
+    started = time.monotonic()
+    backward_time = 0
+    expansions = 0
+
+    def grow_backward():
+        nonlocal growing, backward_time
+        forward_time = time.monotonic() - started - backward_time
+        while growing is not None and backward_time * (1 - backward_share) < forward_time * backward_share:
+            batch_started = time.monotonic()
+            added = next(growing, None)
+            backward_time += time.monotonic() - batch_started
+            if added is None:
+                growing = None
+                break
+            met.extend(forward[key] for key in added if key in forward)
+            if met:
+                break
+
+    def meet_goal_fn(state):
+        nonlocal expansions
+        expansions += 1
+        if expansions % BIDIRECTIONAL_BATCH == 0:
+            grow_backward()
+        return bool(met) or goal_fn(state) or (state.robots[0], state.boxes) in backward
+
+    def meet_heur_fn(state):
+        key = (state.robots[0], state.boxes)
+        seen = forward.get(key)
+        if seen is None or state.gval < seen.gval:
+            forward[key] = state
+        found = backward.get(key)
+        return found[1] if found is not None else heur_fn(state)
+
+    se = SearchEngine('custom', 'full')
+    se.init_search(initial_state, budget.goal(meet_goal_fn), budget.heuristic(meet_heur_fn),
+                   (lambda sN: fval_function(sN, weight)))
+    remain = budget.remaining()
+    if remain <= 0 or budget.check():
+        return False, None
+    final, stats = se.search(remain, (float('inf'), _HVAL_BOUND, float('inf')))
+    if not final:
+        return final, stats
+    if met:
+        final = min(met, key=lambda state: state.gval + backward[(state.robots[0], state.boxes)][1])
+
+    # follow the backward moves from the meeting state to the goal
+    key = (final.robots[0], final.boxes)
+    while not goal_fn(final):
+        key = backward[key][0]
+        final = next(s for s in final.successors() if (s.robots[0], s.boxes) == key)
+    return final, stats
+
+
+def _backward_search(state, level, backward, budget):
+    '''Breadth first search of reversed moves from the goal placements of the boxes of a single robot level, adding
+    (robot, boxes) -> (next (robot, boxes) towards the goal or None, distance to the goal) to backward. A generator:
+    yields the keys added by every batch of BACKWARD_BATCH expanded states, and stops once backward holds
+    BACKWARD_STATES states or budget is spent.'''
+    floor = [level.square(square) for square in range(level.width * level.height) if level.floor[square]]
+    frontier = []
+    for (n, placement) in enumerate(_combinations(level.storage, len(state.boxes))):
+        if n == BACKWARD_GOAL_PLACEMENTS:
+            break
+        boxes = frozenset(placement)
+        for robot in floor:
+            if robot not in boxes:
+                backward[(robot, boxes)] = (None, 0)
+                frontier.append((robot, boxes))
+    yield list(frontier)
+
+    distance = 0
+    added = []
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for (n, key) in enumerate(frontier):
+            if n % BACKWARD_BATCH == BACKWARD_BATCH - 1:
+                yield added
+                added = []
+                if len(backward) >= BACKWARD_STATES or budget.check():
+                    return
+            (robot, boxes) = key
+            for (dx, dy) in _DIRECTIONS:
+                # the robot came from the square behind it, and may have pushed the box in front of it
+                came_from = (robot[0] - dx, robot[1] - dy)
+                if not level.is_floor(*came_from) or came_from in boxes:
+                    continue
+                previous = [(came_from, boxes)]
+                pushed = (robot[0] + dx, robot[1] + dy)
+                if pushed in boxes:
+                    previous.append((came_from, boxes.difference([pushed]).union([robot])))
+                for previous_key in previous:
+                    if previous_key not in backward:
+                        backward[previous_key] = (key, distance)
+                        next_frontier.append(previous_key)
+                        added.append(previous_key)
+        frontier = next_frontier
+    yield added
+
+
+def anytime_repairing_astar(initial_state, heur_fn, weight=10, timebound=5, on_solution=None, profiler=None,
+                            budget=None):
+    '''Provides an implementation of anytime repairing a-star (ARA*)'''
+    '''INPUT: a sokoban state that represents the start state, the initial weight and a timebound (number of wall clock
+    seconds), optionally a function called as on_solution(state, bound) every time a better solution is found, where
+    bound is the factor by which that solution can at most be more expensive than the optimal one (given an admissible
+    heuristic), a SearchProfiler and a Budget to run under instead of the timebound'''
+    '''OUTPUT: A goal state (if a goal is found), else False as well as a SearchStats object'''
+    '''Unlike iterative_astar, a round does not restart from the initial state when the weight decreases: the open list
+    is kept and re-ordered with the new weight, and the states whose g-value improved after they were expanded (the
+    inconsistent states) are put back into it, so each round only repairs the previous search.'''
+    if budget is None:
+        budget = Budget(wall=timebound)
+    best_soln = False
+    best_cost = float('inf')
+    current_weight = weight
+    goal_fn = goal_function(initial_state)
+
+    expanded = generated = pruned_cycles = pruned_cost = 0
+    g = {}  # state hash -> best g-value found so far
+    states = {}  # state hash -> the state reached with that g-value
+    h = {}  # state hash -> heuristic value
+    closed = set()  # expanded in the current round
+    incons = set()  # improved after being expanded in the current round
+    open_list = []  # (fval, hval, tie breaker, state hash, gval), stale entries are skipped when popped
+    counter = 0
+    rounds = 0
+    if profiler is not None:
+        heur_fn = profiler.heuristic(heur_fn)
+        goal_fn = profiler.goal(goal_fn, lambda: len(open_list))
+
+    key = initial_state.hashable_state()
+    g[key] = initial_state.gval
+    states[key] = initial_state
+    h[key] = heur_fn(initial_state)
+    heapq.heappush(open_list, (initial_state.gval + current_weight * h[key], h[key], counter, key, initial_state.gval))
+
+    while True:
+        # improve the solution with the current weight
+        if budget.next_round() <= 0:
+            break
+        timeout = False
+        round_cost = best_cost
+        round_expanded = expanded
+        started = time.perf_counter()
+        while open_list:
+            (fval, hval, tie, key, gval) = heapq.heappop(open_list)
+            if gval != g[key] or key in closed:
+                continue
+            if fval >= best_cost:
+                heapq.heappush(open_list, (fval, hval, tie, key, gval))
+                break
+            if budget.expand():
+                heapq.heappush(open_list, (fval, hval, tie, key, gval))
+                timeout = True
+                break
+            state = states[key]
+            if goal_fn(state):
+                if gval < best_cost:
+                    best_soln = state
+                    best_cost = gval
+                    # g + h of the most promising open state is a lower bound on the optimal cost
+                    lower = min([g[k] + h[k] for (f, hv, t, k, gv) in open_list if gv == g[k]] + [g[k] + h[k] for k in incons],
+                                default=best_cost)
+                    bound = min(current_weight, best_cost / lower) if lower > 0 else current_weight
+                    if on_solution is not None:
+                        on_solution(best_soln, bound)
+                break
+            closed.add(key)
+            expanded += 1
+            for succ in state.successors():
+                generated += 1
+                succ_key = succ.hashable_state()
+                if succ_key in g and succ.gval >= g[succ_key]:
+                    pruned_cycles += 1
+                    continue
+                if succ_key not in h:
+                    h[succ_key] = heur_fn(succ)
+                if h[succ_key] == math.inf or succ.gval + h[succ_key] >= best_cost:
+                    pruned_cost += 1
+                    continue
+                g[succ_key] = succ.gval
+                states[succ_key] = succ
+                if succ_key in closed:
+                    incons.add(succ_key)
+                else:
+                    counter += 1
+                    heapq.heappush(open_list, (succ.gval + current_weight * h[succ_key], h[succ_key], counter, succ_key, succ.gval))
+
+        cut = budget.end_round()
+        rounds += 1
+        if profiler is not None:
+            profiler.round('anytime_repairing_astar', rounds, current_weight, started, expanded - round_expanded,
+                           best_cost if best_cost < round_cost else None)
+
+        if timeout and cut:
+            continue  # out of its slice: the next round goes on from the open list, with the same weight
+        if timeout or current_weight == 1 and (not open_list or open_list[0][0] >= best_cost):
+            break
+        if not open_list and not incons:
+            break
+
+        # lower the weight, move the inconsistent states into the open list and re-order it with the new weight
+        current_weight = max(current_weight * 0.6, 1)
+        keys = set(k for (f, hv, t, k, gv) in open_list if gv == g[k] and k not in closed) | incons
+        open_list = []
+        for k in keys:
+            if g[k] + h[k] < best_cost:
+                counter += 1
+                open_list.append((g[k] + current_weight * h[k], h[k], counter, k, g[k]))
+        heapq.heapify(open_list)
+        closed = set()
+        incons = set()
+
+    stats = SearchStats(expanded, generated, pruned_cycles, pruned_cost, budget.elapsed())
+    return best_soln, stats
+
+def iterative_gbfs(initial_state, heur_fn, timebound=5, on_solution=None, macro=False, profiler=None, budget=None,
+                   bound=None):  # only use h(n)
     # IMPLEMENT
     '''Provides an implementation of anytime greedy best-first search, as described in the HW1 handout'''
-    '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+    '''INPUT: a sokoban state that represents the start state and a timebound (number of wall clock seconds),
+    optionally a function called as on_solution(state, None) every time a better solution is found, whether to search
+    with macro moves (the goal state then has macro actions, see expand_macro_path), a SearchProfiler, a Budget to
+    run under instead of the timebound and a bound on the heuristic (see anytime_heuristic)'''
     '''OUTPUT: A goal state (if a goal is found), else False'''
     '''implementation of iterative gbfs algorithm'''
-    start_time = os.times()[0]
+    if budget is None:
+        budget = Budget(wall=timebound)
     best_soln = None
     best_cost = float('inf')
     best_stats = None
+    if profiler is not None:
+        heur_fn = profiler.heuristic(heur_fn)
+    # heuristic values and best g-values survive from one round to the next
+    heur_fn = anytime_heuristic(heur_fn, budget, bound)
+    if macro:
+        initial_state = macro_state(initial_state)
+    goal_fn = budget.goal(goal_function(initial_state))
+    rounds = 0
 
     while True:
-        used_time = os.times()[0] - start_time
-        remain = timebound - used_time
+        remain = budget.next_round()
         if remain <= 0:
             break
 
         se = SearchEngine(strategy='best_first', cc_level='full')
-        se.init_search(initial_state,  goal_fn=sokoban_goal_state, heur_fn=heur_fn)
+        round_goal_fn = goal_fn
+        if profiler is not None:
+            round_goal_fn = profiler.goal(goal_fn, lambda: _open_size(se))
+            started = time.perf_counter()
+        se.init_search(initial_state,  goal_fn=round_goal_fn, heur_fn=heur_fn)
 
-        costbound = (best_cost, float('inf'), float('inf'))
+        costbound = (best_cost, _HVAL_BOUND, float('inf'))
 
         result, stats = se.search(timebound=remain, costbound=costbound)
+        cut = budget.end_round()
+        rounds += 1
+        if profiler is not None:
+            profiler.round('iterative_gbfs', rounds, None, started, stats.states_expanded, result.gval if result else None)
         if not result:
+            if cut or _open_size(se):
+                continue  # cut short by its slice (or the engine's clock): the next round gets a longer one
             break
 
         if result.gval < best_cost:
             best_soln = result
             best_cost = result.gval
             best_stats = stats
+            if on_solution is not None:
+                on_solution(result, None)
+
+    return best_soln, best_stats
+
 
-    return best_soln, best_stats
\ No newline at end of file
+# PORTFOLIO
+# Which algorithm and heuristic work best changes from level to level, so the portfolio runs several configurations
+# at the same time, one per process. The cost of the best solution found by any of them is kept in shared memory and
+# every worker prunes the states that cannot beat it.
+
+# (algorithm, heuristic, weight), the weight is not used by iterative_gbfs
+PORTFOLIO = (
+    ('iterative_astar', heur_alternate, 10),
+    ('iterative_gbfs', heur_alternate, None),
+    ('weighted_astar', heur_alternate, 3),
+    ('iterative_astar', heur_manhattan_distance, 10),
+    ('iterative_gbfs', heur_manhattan_distance, None),
+    ('weighted_astar', heur_alternate, 1),
+)
+
+PORTFOLIO_GRACE = 0.5  # seconds given to the workers after the timebound to send back their solutions
+
+_incumbent = None  # in a worker: the shared multiprocessing.Value holding the best cost found by the portfolio
+
+
+def bounded_heuristic(heur_fn, incumbent, use_hval=True):
+    '''Wrap heur_fn to return math.inf for states that cannot lead to a solution cheaper than incumbent.value: states
+    whose g-value (plus h-value if use_hval) already reaches it. Used with the h cost bound of the searches. The result
+    depends on the g-value the state is reached with, so it must not be cached per state: the anytime searches take it
+    as their bound, which wraps their transposition table.'''
+    def bounded_heur_fn(state):
+        bound = incumbent.value
+        if state.gval >= bound:
+            return math.inf
+        hval = heur_fn(state)
+        if use_hval and state.gval + hval >= bound:
+            return math.inf
+        return hval
+    return bounded_heur_fn
+
+
+def detach_path(state):
+    '''The states from the initial state to state, unlinked from each other, so that the path can be sent to another
+    process'''
+    path = []
+    while state:
+        path.append(state)
+        state = state.parent
+    path.reverse()
+    for state in path:
+        state.parent = None
+    return path
+
+
+def attach_path(path):
+    '''Link the states returned by detach_path back together and return the last one'''
+    for (parent, state) in zip(path, path[1:]):
+        state.parent = parent
+    return path[-1]
+
+
+def _portfolio_init(incumbent):
+    global _incumbent
+    _incumbent = incumbent
+
+
+def _publish(state, bound):
+    with _incumbent.get_lock():
+        if state.gval < _incumbent.value:
+            _incumbent.value = state.gval
+
+
+def _portfolio_worker(task):
+    (index, algorithm, heur_fn, weight, initial_state, deadline) = task
+    # configurations queued behind others (more configurations than processes) only get what is left of the time
+    timebound = deadline - time.time()
+    if timebound <= 0:
+        return index, None, None
+    if algorithm == 'iterative_gbfs':
+        final, stats = iterative_gbfs(initial_state, heur_fn, timebound, _publish,
+                                      bound=lambda h: bounded_heuristic(h, _incumbent, False))
+    elif algorithm == 'iterative_astar':
+        final, stats = iterative_astar(initial_state, heur_fn, weight, timebound, _publish,
+                                       bound=lambda h: bounded_heuristic(h, _incumbent))
+    elif algorithm == 'weighted_astar':
+        final, stats = weighted_astar(initial_state, bounded_heuristic(heur_fn, _incumbent), weight, timebound)
+        if final:
+            _publish(final, weight)
+    else:
+        raise ValueError("unknown algorithm " + algorithm)
+    if not final:
+        return index, None, stats
+    return index, detach_path(final), stats
+
+
+def portfolio_search(initial_state, timebound=5, portfolio=PORTFOLIO, processes=None):
+    '''Provides a parallel portfolio of the searches above'''
+    '''INPUT: a sokoban state that represents the start state, a timebound (number of seconds), the (algorithm,
+    heuristic, weight) configurations to run and the number of worker processes (default: one per core, at most one
+    per configuration)'''
+    '''OUTPUT: The cheapest goal state found by any configuration (if a goal is found), else False as well as the
+    SearchStats object of the configuration that found it'''
+    deadline = time.time() + timebound
+    incumbent = multiprocessing.Value('d', math.inf)
+    if processes is None:
+        processes = min(len(portfolio), multiprocessing.cpu_count())
+    tasks = [(index, algorithm, heur_fn, weight, initial_state, deadline)
+             for (index, (algorithm, heur_fn, weight)) in enumerate(portfolio)]
+    best_soln = False
+    best_stats = None
+    # leaving the with block terminates the workers that are still running after the deadline
+    with multiprocessing.Pool(processes, initializer=_portfolio_init, initargs=(incumbent,)) as pool:
+        results = pool.imap_unordered(_portfolio_worker, tasks)
+        for _ in tasks:
+            try:
+                (index, path, stats) = results.next(max(deadline - time.time(), 0) + PORTFOLIO_GRACE)
+            except multiprocessing.TimeoutError:
+                break
+            if path is not None and (not best_soln or path[-1].gval < best_soln.gval):
+                best_soln = attach_path(path)
+                best_stats = stats
+    return best_soln, best_stats
@@ -0,0 +1,92 @@
+'''Regression tests of solution.py, run with python -m unittest test_solution (needs search.py and sokoban.py of
+the assignment next to solution.py)'''
+
+import math
+import time
+import types
+import unittest
+
+import solution
+from benchmark import generate_level
+from sokoban import SokobanState
+
+
+class State:
+    '''The part of a search state the heuristic wrappers look at'''
+
+    def __init__(self, key, gval):
+        self.key = key
+        self.gval = gval
+
+    def hashable_state(self):
+        return self.key
+
+
+class BoundedHeuristicTest(unittest.TestCase):
+
+    def test_bound_is_not_cached_per_state(self):
+        # a state reached first through an expensive path is pruned by the incumbent, but not when it is reached again
+        # through a cheaper one
+        incumbent = types.SimpleNamespace(value=12)
+        heur_fn = solution.anytime_heuristic(lambda state: 3, solution.Budget(),
+                                             lambda h: solution.bounded_heuristic(h, incumbent))
+        self.assertEqual(heur_fn(State('a', 10)), math.inf)
+        self.assertEqual(heur_fn(State('a', 8)), 3)
+        # reached again through the expensive path, the transposition table prunes it
+        self.assertEqual(heur_fn(State('a', 10)), math.inf)
+
+
+class BudgetTest(unittest.TestCase):
+
+    def test_round_over_its_slice(self):
+        budget = solution.Budget(wall=10, round_share=0.001)
+        seconds = budget.next_round()
+        time.sleep(2 * seconds)
+        self.assertTrue(budget.check())
+        self.assertTrue(budget.end_round())
+        self.assertGreater(budget.next_round(), 0)
+
+    def test_search_goes_on_after_a_round_over_its_slice(self):
+        # every round only gets 1% of what is left, so the first ones are cut short before they find a solution
+        budget = solution.Budget(wall=6, round_share=0.01)
+        final, stats = solution.iterative_gbfs(generate_level(10, 10, 5, 3), solution.heur_manhattan_distance,
+                                               budget=budget)
+        self.assertTrue(final)
+        self.assertGreater(len(budget.rounds), 1)
+
+
+class MacroMoveTest(unittest.TestCase):
+
+    def assertSameCost(self, state):
+        unit, stats = solution.weighted_astar(state, solution.heur_manhattan_distance, 1, 10)
+        macro, stats = solution.weighted_astar(state, solution.heur_manhattan_distance, 1, 10, macro=True)
+        self.assertTrue(unit)
+        self.assertTrue(macro)
+        self.assertEqual(macro.gval, unit.gval)
+
+    def test_box_stops_at_tunnel_exit(self):
+        # the box is pushed through the tunnel in the middle row, the second robot pushes it down from the square at
+        # its exit
+        obstacles = frozenset((x, y) for x in (3, 4, 5) for y in (0, 2, 3))
+        self.assertSameCost(SokobanState("START", 0, None, 9, 4, ((1, 1), (7, 0)), frozenset([(2, 1)]),
+                                         frozenset([(6, 3)]), obstacles))
+
+    def test_same_cost_as_unit_moves(self):
+        for seed in range(10):
+            self.assertSameCost(generate_level(7, 7, 2, seed, obstacle_density=0.25))
+
+
+class BidirectionalSearchTest(unittest.TestCase):
+
+    def test_does_not_wait_for_the_backward_search(self):
+        for seed in range(5):
+            state = generate_level(9, 9, 3, seed, steps=200)
+            budget = solution.Budget(wall=20)
+            final, stats = solution.bidirectional_search(state, solution.heur_manhattan_distance, budget=budget)
+            unit, stats = solution.weighted_astar(state, solution.heur_manhattan_distance, 1, 10)
+            self.assertEqual(final.gval, unit.gval)
+            self.assertLess(budget.elapsed(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
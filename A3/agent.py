@@ -2,7 +2,12 @@
 An AI player for Othello. 
 """
 
+import array
+import mmap
+import multiprocessing
+import os
 import random
+import struct
 import sys
 import time
 
@@ -10,10 +15,316 @@ import time
 from othello_shared import find_lines, get_possible_moves, get_score, play_move
 
 cache = {} # Use this for state caching
+ZOBRIST_SEED = 384 # the zobrist keys are the same in every run
 
 def eprint(*args, **kwargs): #use this for debugging, to print to sterr
     print(*args, file=sys.stderr, **kwargs)
-    
+
+############ BITBOARDS #############################
+# A board of size n is held as two integers, one bit per square for the dark and one for the light disks. Square (i, j)
+# (column i, row j, as in board[j][i]) is bit i + j * n, so row j is the n bits starting at j * n.
+# Moves and flips are found by shifting whole bitboards one square at a time in each of the 8 directions instead of
+# walking the board square by square.
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+class BitBoard:
+    """
+    Masks and lookup tables for the bitboards of one board size.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.full = (1 << (n * n)) - 1
+        self.row_mask = (1 << n) - 1
+        first_column = sum(1 << (j * n) for j in range(n))
+        not_first_column = self.full & ~first_column
+        not_last_column = self.full & ~(first_column << (n - 1))
+        # (shift, mask of the squares that may move that way): east, west, south, north and the 4 diagonals
+        self.directions = ((1, not_last_column), (-1, not_first_column), (n, self.full), (-n, self.full),
+                           (n + 1, not_last_column), (n - 1, not_first_column),
+                           (-(n - 1), not_last_column), (-(n + 1), not_first_column))
+        self.coordinates = [(s % n, s // n) for s in range(n * n)]
+        # zobrist keys: zobrist[square][color] for every disk on the board, turn_keys[color] marks the player to move
+        # and player_keys[color] the player searching
+        rng = random.Random(ZOBRIST_SEED + n)
+        self.zobrist = [(0, rng.getrandbits(64), rng.getrandbits(64)) for _ in range(n * n)]
+        self.turn_keys = (0, rng.getrandbits(64), rng.getrandbits(64))
+        self.player_keys = (0, rng.getrandbits(64), rng.getrandbits(64))
+        self.weights = [square_weight(n, s % n, s // n) for s in range(n * n)]
+        self.corners = 1 | (1 << (n - 1)) | (1 << (n * (n - 1))) | (1 << (n * n - 1))
+        # the 8 symmetries of the board (rotations and reflections): symmetries[t][s] is where square s goes under t
+        images = (lambda i, j: (i, j), lambda i, j: (n - 1 - j, i), lambda i, j: (n - 1 - i, n - 1 - j),
+                  lambda i, j: (j, n - 1 - i), lambda i, j: (n - 1 - i, j), lambda i, j: (i, n - 1 - j),
+                  lambda i, j: (j, i), lambda i, j: (n - 1 - j, n - 1 - i))
+        self.symmetries = []
+        self.inverse_symmetries = []
+        for image in images:
+            symmetry = [0] * (n * n)
+            inverse = [0] * (n * n)
+            for s in range(n * n):
+                (i, j) = image(s % n, s // n)
+                symmetry[s] = i + j * n
+                inverse[i + j * n] = s
+            self.symmetries.append(symmetry)
+            self.inverse_symmetries.append(inverse)
+        # a position has one zobrist key per symmetry, the key of its image under that symmetry: image_keys[square]
+        # [color] are the 8 keys of a disk on square, flip_keys[square] change the color of the disk on square
+        self.image_keys = [tuple(tuple(self.zobrist[symmetry[s]][color] for symmetry in self.symmetries)
+                                 for color in range(3)) for s in range(n * n)]
+        self.flip_keys = [tuple(dark ^ light for (dark, light) in zip(keys[1], keys[2])) for keys in self.image_keys]
+        # the four quadrants of the board, for the parity of the empty squares in the endgame
+        self.regions = [sum(1 << s for s in range(n * n) if (2 * (s % n) >= n) == right and (2 * (s // n) >= n) == low)
+                        for right in (False, True) for low in (False, True)]
+        self.row_bits = {} # row of the board -> (dark bits, light bits) of that row
+        self.row_cells = {} # (dark bits, light bits) of a row -> row of the board
+
+    def shift(self, bits, shift, mask):
+        if shift > 0:
+            return ((bits & mask) << shift) & self.full
+        return (bits & mask) >> -shift
+
+    def moves(self, own, opp):
+        """
+        Bitboard of the empty squares where the player with the disks own can play.
+        """
+        empty = self.full & ~(own | opp)
+        moves = 0
+        for (shift, mask) in self.directions:
+            if shift > 0:
+                line = ((own & mask) << shift) & opp
+                for _ in range(self.n - 3):
+                    line |= ((line & mask) << shift) & opp
+                moves |= ((line & mask) << shift) & empty
+            else:
+                line = ((own & mask) >> -shift) & opp
+                for _ in range(self.n - 3):
+                    line |= ((line & mask) >> -shift) & opp
+                moves |= ((line & mask) >> -shift) & empty
+        return moves
+
+    def flips(self, own, opp, square):
+        """
+        Bitboard of the opponent disks flipped when the player with the disks own plays on square.
+        """
+        flipped = 0
+        for (shift, mask) in self.directions:
+            line = 0
+            bit = self.shift(1 << square, shift, mask)
+            while bit & opp:
+                line |= bit
+                bit = self.shift(bit, shift, mask)
+            if bit & own:
+                flipped |= line
+        return flipped
+
+    def squares(self, bits):
+        """
+        The squares of the set bits, lowest first.
+        """
+        squares = []
+        while bits:
+            low = bits & -bits
+            squares.append(low.bit_length() - 1)
+            bits ^= low
+        return squares
+
+    def keys(self, dark, light):
+        """
+        Zobrist keys of the 8 symmetric images of the board.
+        """
+        keys = (0,) * 8
+        for s in self.squares(dark):
+            keys = tuple(key ^ image for (key, image) in zip(keys, self.image_keys[s][1]))
+        for s in self.squares(light):
+            keys = tuple(key ^ image for (key, image) in zip(keys, self.image_keys[s][2]))
+        return keys
+
+    def transform(self, bits, symmetry):
+        """
+        The bitboard bits under the symmetry with that number.
+        """
+        image = 0
+        squares = self.symmetries[symmetry]
+        for s in self.squares(bits):
+            image |= 1 << squares[s]
+        return image
+
+    def to_bits(self, board):
+        dark = light = 0
+        row_bits = self.row_bits
+        for j in range(self.n):
+            row = tuple(board[j])
+            bits = row_bits.get(row)
+            if bits is None:
+                bits = (sum(1 << i for i in range(self.n) if row[i] == 1), sum(1 << i for i in range(self.n) if row[i] == 2))
+                row_bits[row] = bits
+            dark |= bits[0] << (j * self.n)
+            light |= bits[1] << (j * self.n)
+        return dark, light
+
+    def to_rows(self, dark, light):
+        rows = []
+        row_cells = self.row_cells
+        for j in range(self.n):
+            bits = ((dark >> (j * self.n)) & self.row_mask, (light >> (j * self.n)) & self.row_mask)
+            row = row_cells.get(bits)
+            if row is None:
+                row = tuple(1 if bits[0] >> i & 1 else 2 if bits[1] >> i & 1 else 0 for i in range(self.n))
+                row_cells[bits] = row
+            rows.append(row)
+        return rows
+
+def square_weight(n, i, j):
+    """
+    How good it usually is to play on column i and row j: corners cannot be flipped, but the squares next to a corner
+    give it away to the opponent.
+    """
+    near_i = min(i, n - 1 - i)
+    near_j = min(j, n - 1 - j)
+    if near_i == 0 and near_j == 0:
+        return 100
+    if near_i <= 1 and near_j <= 1:
+        return -50 if near_i == near_j else -20
+    if near_i == 0 or near_j == 0:
+        return 10
+    return 0
+
+bitboards = {} # board size -> BitBoard
+
+def bitboard(n):
+    if n not in bitboards:
+        bitboards[n] = BitBoard(n)
+    return bitboards[n]
+
+class Position(tuple):
+    """
+    A board (a tuple of rows, like the ones play_move returns) that also carries its bitboards, zobrist keys and what
+    compute_heuristic needs: the number of disks of each player, and the moves of each player once they are known.
+    The keys are those of the 8 rotations and reflections of the board. The smallest of them, key, is the same for all
+    8 of them, and symmetry is the number of the image with that key. With an evaluation that gives the same value on
+    every image, the caches key positions on key and store moves in that image, so the 8 images share their entries
+    (see cache_symmetry).
+    """
+    def __new__(cls, rows, dark=None, light=None, keys=None, counts=None):
+        self = tuple.__new__(cls, rows)
+        if dark is None:
+            dark, light = bitboard(len(self)).to_bits(self)
+        if keys is None:
+            keys = bitboard(len(self)).keys(dark, light)
+        if counts is None:
+            counts = (popcount(dark), popcount(light))
+        self.dark = dark
+        self.light = light
+        self.keys = keys
+        self.key = min(keys)
+        self.symmetry = keys.index(self.key)
+        self.counts = counts
+        self.dark_moves = None
+        self.light_moves = None
+        return self
+
+    def __getnewargs__(self):
+        return (tuple(self), self.dark, self.light, self.keys)
+
+def position(board):
+    """
+    The board as a Position, converting it if it is a plain board (list or tuple of rows).
+    """
+    if isinstance(board, Position):
+        return board
+    return Position(tuple(tuple(row) for row in board))
+
+def starting_board(n):
+    """
+    The Position at the start of a game on an n x n board.
+    """
+    board = [[0] * n for _ in range(n)]
+    middle = n // 2
+    board[middle - 1][middle - 1] = board[middle][middle] = 2
+    board[middle - 1][middle] = board[middle][middle - 1] = 1
+    return position(board)
+
+def moves_of(board, color):
+    """
+    Bitboard of the moves of color on the Position board, computed once per board and color.
+    """
+    if color == 1:
+        if board.dark_moves is None:
+            board.dark_moves = bitboard(len(board)).moves(board.dark, board.light)
+        return board.dark_moves
+    if board.light_moves is None:
+        board.light_moves = bitboard(len(board)).moves(board.light, board.dark)
+    return board.light_moves
+
+def fast_possible_moves(board, color):
+    """
+    Same as get_possible_moves: the moves (i, j) of color, sorted by column i and then row j.
+    """
+    board = position(board)
+    bits = bitboard(len(board))
+    result = [bits.coordinates[s] for s in bits.squares(moves_of(board, color))]
+    result.sort()
+    return result
+
+def fast_play_move(board, color, i, j, flipped = None):
+    """
+    Same as play_move: the board after color plays on column i and row j, as a Position. flipped are the disks the move
+    flips, if they are already known.
+    """
+    board = position(board)
+    bits = bitboard(len(board))
+    square = i + j * bits.n
+    if color == 1:
+        if flipped is None:
+            flipped = bits.flips(board.dark, board.light, square)
+        dark, light = board.dark | flipped | (1 << square), board.light & ~flipped
+    else:
+        if flipped is None:
+            flipped = bits.flips(board.light, board.dark, square)
+        dark, light = board.dark & ~flipped, board.light | flipped | (1 << square)
+    keys = tuple(key ^ image for (key, image) in zip(board.keys, bits.image_keys[square][color]))
+    for s in bits.squares(flipped):
+        keys = tuple(key ^ image for (key, image) in zip(keys, bits.flip_keys[s]))
+    count = popcount(flipped)
+    if color == 1:
+        counts = (board.counts[0] + count + 1, board.counts[1] - count)
+    else:
+        counts = (board.counts[0] - count, board.counts[1] + count + 1)
+    return Position(bits.to_rows(dark, light), dark, light, keys, counts)
+
+def cache_symmetry(board, evaluation):
+    """
+    The number of the image of the Position board that the caches use, in a search that evaluates positions with
+    evaluation: the one with the key board.key, shared by the 8 images of the board, if evaluation is known to give
+    the same value on every image (see SYMMETRIC_EVALUATIONS), else the board itself (0).
+    """
+    return board.symmetry if evaluation in SYMMETRIC_EVALUATIONS else 0
+
+def to_canonical(board, move, symmetry):
+    """
+    The square that move on the Position board is in the image of board with the number symmetry.
+    """
+    if move is None:
+        return None
+    bits = bitboard(len(board))
+    return bits.symmetries[symmetry][move[0] + move[1] * bits.n]
+
+def from_canonical(board, square, symmetry):
+    """
+    The move (i, j) on the Position board that is square in the image of board with the number symmetry.
+    """
+    if square is None:
+        return None
+    bits = bitboard(len(board))
+    return bits.coordinates[bits.inverse_symmetries[symmetry][square]]
+
+def fast_score(board):
+    """
+    Same as get_score: the number of dark and light disks.
+    """
+    return position(board).counts
+
 def compute_utility(board, color):
     # IMPLEMENT!
     """
@@ -21,7 +332,7 @@ def compute_utility(board, color):
     INPUT: a game state and the player that is in control
     OUTPUT: an integer that represents utility
     """
-    dark_score, white_score = get_score(board)
+    dark_score, white_score = fast_score(board)
     if color == 1:
         return dark_score - white_score
     else:
@@ -48,45 +359,28 @@ def compute_heuristic(board, color):
     # At the end of the game, occupied cells including corners are a lot more important, while possible moves and corners
     # are not that important because we want to have the board filled by our color.
 
-    # score difference
-    dark_score, white_score = get_score(board)
+    # everything is read off the Position: disk counts, corners from the bitboards and the moves of both players
+    board = position(board)
+    bits = bitboard(len(board))
     if color == 1:
-        score_diff = dark_score - white_score
+        own, opp = board.dark, board.light
+        score_diff = board.counts[0] - board.counts[1]
     else:
-        score_diff = white_score - dark_score
+        own, opp = board.light, board.dark
+        score_diff = board.counts[1] - board.counts[0]
+    own_moves = moves_of(board, color)
+    opp_moves = moves_of(board, 3 - color)
 
     # corner + opponent corner
-    corner = 0
-    opponent_corner = 0
-    corners = [(0, 0), (0, len(board) - 1), (len(board) - 1, len(board) - 1), (len(board) - 1, 0)]
-    for (i, j) in corners:
-        if board[i][j] == color:
-            corner += 1
-        elif board[i][j] == (3 - color):
-            opponent_corner += 1
-    corner_diff = (corner - opponent_corner) * 10
+    corner_diff = (popcount(own & bits.corners) - popcount(opp & bits.corners)) * 10
 
     # moves available + corner
-    future_corner = 0
-    future_oppo_corner = 0
-    for move in get_possible_moves(board, color):
-        if move == board[0][0] or move == board[0][len(board) - 1] or move == board[len(board) - 1][len(board) - 1] or move == board[len(board) - 1][0]:
-            future_corner += 1
-    for move in get_possible_moves(board, 3 - color):
-        if move == board[0][0] or move == board[0][len(board) - 1] or move == board[len(board) - 1][len(board) - 1] or move == board[len(board) - 1][0]:
-            future_oppo_corner += 1
-    future_corner_diff = (future_corner - future_oppo_corner) * 10
-            
-    movable = len(get_possible_moves(board, color)) - len(get_possible_moves(board, 3 - color))
+    future_corner_diff = (popcount(own_moves & bits.corners) - popcount(opp_moves & bits.corners)) * 10
+
+    movable = popcount(own_moves) - popcount(opp_moves)
 
     # check which stage the game is at
-    total = len(board) * len(board)
-    occupied = 0
-    for i in board:
-        for j in i:
-            if j != 0:
-                occupied += 1
-    stage = occupied / total
+    stage = (board.counts[0] + board.counts[1]) / (bits.n * bits.n)
 
     if stage < 0.25:
         score_weight = 1
@@ -107,7 +401,468 @@ def compute_heuristic(board, color):
     heuristic_value = (score_weight * score_diff + corner_weight * corner_diff + future_corner_weight * future_corner_diff + movable_weight * movable)
     return heuristic_value
     
+############ PATTERN EVALUATION ####################
+# A table-driven alternative to compute_heuristic. The board is cut into patterns, lines of squares read in a fixed
+# order: the 4 edges, the 4 lines next to them, the 2 diagonals and the 3x3 squares in the 4 corners. Patterns that are
+# rotations or reflections of each other form a group and share one table. A pattern's index is its squares read as a
+# number in base 3 (0 empty, 1 a disk of the player evaluated, 2 an opponent disk), and the value of a board is the sum
+# of the table entries of its patterns, with one set of tables per phase of the game (how full the board is).
+# A rotation or reflection of the board maps every pattern onto a pattern of its group, but may read it the other way
+# round: a line from its other end, a corner square column by column instead of row by row. So a pattern and its
+# mirror reading share one entry (see pattern_canonical), which makes the value the same on all 8 images of a board.
+# The tables are fitted offline by tune_patterns.py, which plays games against itself and fits the tables to the final
+# disk difference by least squares. They are stored in patterns_<n>.bin next to this file:
+#   header: "OTHPA2", n, number of phases, number of groups (struct "<6sHHH")
+#   for every phase, for every group: 3 ** (squares in the group's patterns) little endian 32-bit floats, of which only
+#   the entries of canonical indices are used
+# Without a file for the board size, the search uses compute_heuristic.
+PATTERN_HEADER = struct.Struct("<6sHHH")
+PATTERN_MAGIC = b"OTHPA2" # files of the first version ("OTHPAT") did not share entries between mirror readings
+PATTERN_PHASES = 4
+
+def pattern_groups(n):
+    """
+    [(name, patterns)] for a board of size n, a pattern being the list of its squares in reading order.
+    """
+    def square(i, j):
+        return i + j * n
+
+    def around(line):
+        # the line at distance line from the edge, read clockwise on every side of the board
+        return [[square(a, line) for a in range(n)], [square(n - 1 - line, a) for a in range(n)],
+                [square(n - 1 - a, n - 1 - line) for a in range(n)], [square(line, n - 1 - a) for a in range(n)]]
+
+    corners = [[square(ci + di * a, cj + dj * b) for b in range(3) for a in range(3)]
+               for (ci, cj, di, dj) in ((0, 0, 1, 1), (n - 1, 0, -1, 1), (n - 1, n - 1, -1, -1), (0, n - 1, 1, -1))]
+    diagonals = [[square(a, a) for a in range(n)], [square(n - 1 - a, a) for a in range(n)]]
+    return [("edge", around(0)), ("line", around(1)), ("diagonal", diagonals), ("corner", corners)]
+
+def pattern_canonical(n):
+    """
+    For every group of pattern_groups(n), canonical[index] is the smaller of index and the index of the same squares in
+    mirror reading order (a line from its other end, a corner square column by column).
+    """
+    canonical = []
+    for (name, patterns) in pattern_groups_of(n):
+        length = len(patterns[0])
+        if name == "corner":
+            mirror = [3 * (p % 3) + p // 3 for p in range(length)] # square p is on row p // 3 and column p % 3
+        else:
+            mirror = [length - 1 - p for p in range(length)]
+        table = array.array("I", range(3 ** length))
+        for index in range(3 ** length):
+            digits = []
+            rest = index
+            for _ in range(length):
+                digits.append(rest % 3)
+                rest //= 3
+            digits.reverse() # digits[p] is the state of the p-th square of the pattern
+            mirrored = 0
+            for p in range(length):
+                mirrored = mirrored * 3 + digits[mirror[p]]
+            table[index] = min(index, mirrored)
+        canonical.append(table)
+    return canonical
+
+def pattern_phase(board):
+    n = len(board)
+    return (board.counts[0] + board.counts[1]) * PATTERN_PHASES // (n * n + 1)
+
+def pattern_indices(board, color):
+    """
+    [(group number, index)] of the patterns of the Position board, for color.
+    """
+    if color == 1:
+        own, opp = board.dark, board.light
+    else:
+        own, opp = board.light, board.dark
+    indices = []
+    canonical = pattern_canonical_of(len(board))
+    for (group, (name, patterns)) in enumerate(pattern_groups_of(len(board))):
+        for pattern in patterns:
+            index = 0
+            for s in pattern:
+                index = index * 3 + (1 if own >> s & 1 else 2 if opp >> s & 1 else 0)
+            indices.append((group, canonical[group][index]))
+    return indices
+
+groups_by_size = {} # board size -> pattern_groups
+canonical_by_size = {} # board size -> pattern_canonical
+pattern_tables = {} # board size -> tables[phase][group] (array of floats), or None without a file
+
+def pattern_groups_of(n):
+    if n not in groups_by_size:
+        groups_by_size[n] = pattern_groups(n)
+    return groups_by_size[n]
+
+def pattern_canonical_of(n):
+    if n not in canonical_by_size:
+        canonical_by_size[n] = pattern_canonical(n)
+    return canonical_by_size[n]
+
+def pattern_path(n, directory = None):
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory, "patterns_%d.bin" % n)
+
+def save_patterns(n, tables, path):
+    with open(path, "wb") as f:
+        f.write(PATTERN_HEADER.pack(PATTERN_MAGIC, n, len(tables), len(tables[0])))
+        for phase in tables:
+            for table in phase:
+                data = array.array("f", table)
+                if sys.byteorder == "big":
+                    data.byteswap()
+                f.write(data.tobytes())
+
+def load_patterns(n, path):
+    """
+    tables[phase][group] from the file at path, None if it is missing or is not for boards of size n.
+    """
+    if not os.path.exists(path):
+        return None
+    sizes = [3 ** len(patterns[0]) for (name, patterns) in pattern_groups_of(n)]
+    with open(path, "rb") as f:
+        (magic, size, phases, groups) = PATTERN_HEADER.unpack(f.read(PATTERN_HEADER.size))
+        if magic != PATTERN_MAGIC or size != n or groups != len(sizes):
+            return None
+        tables = []
+        for _ in range(phases):
+            phase = []
+            for length in sizes:
+                table = array.array("f")
+                table.frombytes(f.read(4 * length))
+                if sys.byteorder == "big":
+                    table.byteswap()
+                phase.append(table)
+            tables.append(phase)
+    return tables
+
+def patterns_for(n):
+    if n not in pattern_tables:
+        pattern_tables[n] = load_patterns(n, pattern_path(n))
+    return pattern_tables[n]
+
+def compute_pattern_heuristic(board, color):
+    """
+    Value of board for color from the pattern tables, compute_heuristic if there are none for its size.
+    INPUT: a game state and the player that is in control
+    OUTPUT: a number that estimates the final disk difference for color
+    """
+    board = position(board)
+    tables = patterns_for(len(board))
+    if tables is None:
+        return compute_heuristic(board, color)
+    phase = tables[pattern_phase(board)]
+    return sum(phase[group][index] for (group, index) in pattern_indices(board, color))
+
+def search_evaluation(board):
+    """
+    The evaluation for non-terminal positions at the depth limit of the timed searches.
+    """
+    if patterns_for(len(board)) is not None:
+        return compute_pattern_heuristic
+    return compute_heuristic
+
+############ OPENING BOOK ##########################
+# The first moves of a game are read from an opening book built offline by build_book.py, which searches every
+# position of the first plies deeply. Positions that are rotations or reflections of each other are stored once, as
+# their canonical image: the smallest (dark, light) bitboard pair among the 8 symmetric images of the position. The book
+# file, book_<n>.bin next to this file, is a header followed by records sorted by key, which run_ai searches by
+# bisection in the memory-mapped file:
+#   header: "OTHBOK", n, number of records, record size (struct "<6sHII")
+#   record: key (the canonical dark and light bitboards, ceil(n * n / 8) big endian bytes each, and the player to
+#           move), the book move as a square of the canonical image and the value the search found for it
+#           (struct "<Hh")
+BOOK_HEADER = struct.Struct("<6sHII")
+BOOK_MOVE = struct.Struct("<Hh")
+
+def canonical_position(board, color):
+    """
+    (key, symmetry) of the Position board with color to move: the book key of its canonical image and the number of
+    the symmetry that turns board into that image.
+    """
+    bits = bitboard(len(board))
+    best = None
+    for symmetry in range(8):
+        image = (bits.transform(board.dark, symmetry), bits.transform(board.light, symmetry))
+        if best is None or image < best[0]:
+            best = (image, symmetry)
+    ((dark, light), symmetry) = best
+    size = (bits.n * bits.n + 7) // 8
+    return dark.to_bytes(size, "big") + light.to_bytes(size, "big") + bytes([color]), symmetry
+
+class OpeningBook:
+    """
+    An opening book file, memory-mapped.
+    """
+    def __init__(self, path, n):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, size, self.count, self.record) = BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != b"OTHBOK" or size != n:
+            raise ValueError("%s is not an opening book for boards of size %d" % (path, n))
+        self.n = n
+        self.key_size = self.record - BOOK_MOVE.size
+
+    def lookup(self, board, color):
+        """
+        The book move (i, j) of color on board, None if the position is not in the book.
+        """
+        board = position(board)
+        (key, symmetry) = canonical_position(board, color)
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = BOOK_HEADER.size + middle * self.record
+            found = self.data[offset:offset + self.key_size]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                (square, value) = BOOK_MOVE.unpack_from(self.data, offset + self.key_size)
+                bits = bitboard(self.n)
+                return bits.coordinates[bits.inverse_symmetries[symmetry][square]]
+        return None
+
+def book_path(n, directory = None):
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory, "book_%d.bin" % n)
+
+def save_book(n, entries, path):
+    """
+    Write the book {key: (square, value)} to path.
+    """
+    size = (n * n + 7) // 8
+    with open(path, "wb") as f:
+        f.write(BOOK_HEADER.pack(b"OTHBOK", n, len(entries), 2 * size + 1 + BOOK_MOVE.size))
+        for key in sorted(entries):
+            (square, value) = entries[key]
+            f.write(key + BOOK_MOVE.pack(square, max(-32768, min(32767, int(round(value))))))
+
+books = {} # board size -> OpeningBook, or None without a book file
+
+def book_move(board, color):
+    """
+    The opening book move of color on board, None if there is no book for its size or the position is not in it.
+    """
+    n = len(board)
+    if n not in books:
+        books[n] = OpeningBook(book_path(n), n) if os.path.exists(book_path(n)) else None
+    if books[n] is None:
+        return None
+    return books[n].lookup(board, color)
+
+############ TRANSPOSITION TABLE ###################
+# Alpha-beta stores what it learns about a position in a table of fixed size, indexed by the zobrist key of the position
+# (the same for all its rotations and reflections, with moves stored as squares of its canonical image),
+# the player to move and the player searching. An entry holds the depth searched below the position, the value found,
+# whether that value is exact or only a lower or upper bound (the search was cut off outside its alpha-beta window), and
+# the best move. Every index has two slots: the first keeps the deepest entry of the current search, the second always
+# takes the newest entry that is not deep enough for the first.
+TRANSPOSITION_TABLE_BITS = 16 # 2 ** 16 indices of 2 slots
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """
+    Fixed size table of (key, depth, value, flag, best move, search) entries.
+    """
+    def __init__(self, bits=TRANSPOSITION_TABLE_BITS):
+        self.mask = (1 << bits) - 1
+        self.slots = [None] * (2 << bits)
+        self.search = 0 # entries of earlier searches may be replaced by shallower ones
+
+    def new_search(self):
+        self.search += 1
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        entry = self.slots[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.slots[index + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, move):
+        index = (key & self.mask) << 1
+        kept = self.slots[index]
+        if kept is None or kept[0] == key or depth >= kept[1] or kept[5] != self.search:
+            self.slots[index] = (key, depth, value, flag, move, self.search)
+        else:
+            self.slots[index + 1] = (key, depth, value, flag, move, self.search)
+
+transposition_table = TranspositionTable()
+
+def table_key(board, color, player):
+    """
+    Key of board with player to move, in a search for color.
+    """
+    bits = bitboard(len(board))
+    return board.keys[cache_symmetry(board, leaf_evaluation)] ^ bits.turn_keys[player] ^ bits.player_keys[color]
+
+def table_depth(board, limit):
+    """
+    Depth searched below board with the given depth limit, where no limit (-1) searches to the end of the game.
+    """
+    if limit < 0:
+        return len(board) * len(board)
+    return limit
+
+def store_result(key, board, limit, window, move, value):
+    """
+    Store the value a search with the alpha-beta window found for board: a value outside the window is only a bound.
+    """
+    alpha = window[0]
+    if shared_alpha is not None:
+        # in a parallel search the nodes below may have searched with a higher alpha another worker published since
+        alpha = max(alpha, shared_alpha.value)
+    if value <= alpha:
+        flag = UPPER
+    elif value >= window[1]:
+        flag = LOWER
+    else:
+        flag = EXACT
+    transposition_table.store(key, table_depth(board, limit), value, flag, to_canonical(board, move, cache_symmetry(board, leaf_evaluation)))
+
+############ MOVE ORDERING #########################
+# With node ordering on, alpha-beta tries the moves of a node in this order, without building their boards first:
+# 1. the hash move, the best move an earlier search stored in the transposition table for this position (with state
+#    caching on)
+# 2. the killer moves, the last two moves that caused a cutoff at the same depth
+# 3. the other moves by the number of disks they flip (FLIP_WEIGHT each), their history score (how often and how deep
+#    they caused cutoffs so far) and the weight of their square
+# The flipped disks are found on the bitboards and passed on to fast_play_move when the move is searched.
+FLIP_WEIGHT = 100
+killer_moves = {} # depth limit -> the last two moves that caused a cutoff there
+history = {} # (player, move) -> history score
+
+def order_moves(board, player, moves, limit, hash_move):
+    """
+    The moves of player in the order to search them, and the disks each of them flips.
+    """
+    n = len(board)
+    bits = bitboard(n)
+    if player == 1:
+        own, opp = board.dark, board.light
+    else:
+        own, opp = board.light, board.dark
+    killers = killer_moves.get(limit, ())
+    flips = {}
+    priorities = {}
+    for move in moves:
+        square = move[0] + move[1] * n
+        flips[move] = bits.flips(own, opp, square)
+        priorities[move] = (move == hash_move, move in killers, FLIP_WEIGHT * popcount(flips[move]) +
+                            history.get((player, move), 0) + bits.weights[square])
+    return sorted(moves, key=priorities.get, reverse=True), flips
+
+def record_cutoff(player, move, limit):
+    killers = killer_moves.get(limit, [])
+    if move not in killers:
+        killer_moves[limit] = [move] + killers[:1]
+    depth = limit if limit > 0 else 1
+    history[(player, move)] = history.get((player, move), 0) + depth * depth
+
+def age_history():
+    """
+    Halve the history scores and forget the killer moves before a new search, so recent cutoffs count the most.
+    """
+    killer_moves.clear()
+    for move in list(history):
+        history[move] //= 2
+        if history[move] == 0:
+            del history[move]
+
+############ ENDGAME ###############################
+# With at most ENDGAME_EMPTIES empty squares, a search that would reach the end of the game anyway (no depth limit, or
+# a limit of at least the number of empty squares) is handed to an exact solver that works on the bitboards alone. It
+# searches with null windows (principal variation search: the first move with the full window, the others only to
+# show they are not better, re-searched if they are) and orders the moves by how few replies they leave the opponent
+# (fastest first), then by parity: squares in a quadrant with an odd number of empty squares first, as the last move in
+# a region is usually worth having. Like the rest of this file, a player without moves ends the game.
+# The solver looks at the deadline like the other searches, so a timed search that runs out of time in it falls back
+# to the move of the last depth it completed. On 8x8, 12 empty squares take 1.5 seconds at most, 14 up to 20.
+ENDGAME_EMPTIES = 12
+FASTEST_FIRST_EMPTIES = 4 # with at most this many empty squares, moves are only ordered by parity
+
+def empty_squares(board):
+    return popcount(bitboard(len(board)).full & ~(board.dark | board.light))
+
+def solve_endgame(board, player, color, alpha, beta):
+    """
+    Exact (move, value) of board with player to move and the value for color, like alphabeta_max_node and
+    alphabeta_min_node without a depth limit.
+    """
+    bits = bitboard(len(board))
+    bound = bits.n * bits.n + 1 # more than any disk difference, so null windows around it stay finite
+    if player == 1:
+        own, opp = board.dark, board.light
+    else:
+        own, opp = board.light, board.dark
+    if player == color:
+        value, square = endgame_search(bits, own, opp, max(alpha, -bound), min(beta, bound))
+    else:
+        value, square = endgame_search(bits, own, opp, max(-beta, -bound), min(-alpha, bound))
+        value = -value
+    return (None if square is None else bits.coordinates[square]), value
+
+def endgame_search(bits, own, opp, alpha, beta):
+    """
+    (value, best square) for the player with the disks own to move, the value being their disk difference at the end.
+    """
+    check_deadline()
+    moves = bits.moves(own, opp)
+    if not moves:
+        return popcount(own) - popcount(opp), None
+    empty = bits.full & ~(own | opp)
+    odd = 0
+    for region in bits.regions:
+        if popcount(empty & region) & 1:
+            odd |= region
+    children = []
+    for square in bits.squares(moves):
+        flipped = bits.flips(own, opp, square)
+        child_own = opp & ~flipped
+        child_opp = own | flipped | (1 << square)
+        priority = (1 << square) & odd != 0
+        if popcount(empty) > FASTEST_FIRST_EMPTIES:
+            priority = (-popcount(bits.moves(child_own, child_opp)), priority)
+        children.append((priority, square, child_own, child_opp))
+    children.sort(key=lambda child: child[0], reverse=True)
+
+    best_value = float("-inf")
+    best_square = None
+    for (priority, square, child_own, child_opp) in children:
+        if best_square is None:
+            value = -endgame_search(bits, child_own, child_opp, -beta, -alpha)[0]
+        else:
+            value = -endgame_search(bits, child_own, child_opp, -alpha - 1, -alpha)[0]
+            if alpha < value < beta:
+                value = -endgame_search(bits, child_own, child_opp, -beta, -value)[0]
+        if value > best_value:
+            best_value = value
+            best_square = square
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            break
+    return best_value, best_square
+
 ############ MINIMAX ###############################
+# The minimax cache holds (best move, value) per position, keyed on the zobrist key of the image of the position that
+# cache_symmetry picks for compute_utility (the same for its 8 images), the player to move, the player searching and
+# the depth limit (any negative one meaning none). Moves are stored as squares of that image and mapped back to the
+# board they are read for.
+def cache_key(board, player, color, limit):
+    return (board.keys[cache_symmetry(board, compute_utility)], player, color, limit if limit >= 0 else -1)
+
 def minimax_min_node(board, color, limit, caching = 0):
     # IMPLEMENT!
     """
@@ -119,25 +874,29 @@ def minimax_min_node(board, color, limit, caching = 0):
     # 3. If not, for each possible move, get the max utiltiy
     # 4. After checking every move, you can find the minimum utility
     # ...
-    if caching and (board, 3 - color) in cache:
-        return cache[(board, 3 - color)]
+    board = position(board)
+    if caching:
+        key = cache_key(board, 3 - color, color, limit)
+        if key in cache:
+            square, value = cache[key]
+            return from_canonical(board, square, cache_symmetry(board, compute_utility)), value
 
-    moves = get_possible_moves(board, 3 - color)
+    moves = fast_possible_moves(board, 3 - color)
     if moves == [] or limit == 0:
         return None, compute_utility(board, color)
     
     curr_min = float('inf')
     for move in moves:
-        new_board = play_move(board, 3 - color, move[0], move[1])
+        new_board = fast_play_move(board, 3 - color, move[0], move[1])
 
         oppo_move, value = minimax_max_node(new_board, color, limit - 1, caching)
-        if caching:
-            cache[(new_board, 3 - color)] = (move, value)
 
         if value < curr_min:
             best_move = move
             curr_min = value
 
+    if caching:
+        cache[key] = (to_canonical(board, best_move, cache_symmetry(board, compute_utility)), curr_min)
     return best_move, curr_min
 
 
@@ -152,26 +911,30 @@ def minimax_max_node(board, color, limit, caching = 0):
     # 3. If not, for each possible move, get the min utiltiy
     # 4. After checking every move, you can find the maximum utility
     # ...
-    if caching and (board, color) in cache:
-        return cache[(board, color)]
+    board = position(board)
+    if caching:
+        key = cache_key(board, color, color, limit)
+        if key in cache:
+            square, value = cache[key]
+            return from_canonical(board, square, cache_symmetry(board, compute_utility)), value
 
-    moves = get_possible_moves(board, color)
+    moves = fast_possible_moves(board, color)
 
     if moves == [] or limit == 0:
         return None, compute_utility(board, color)
     
     curr_max = -float('inf')
     for move in moves:
-        new_board = play_move(board, color, move[0], move[1])
+        new_board = fast_play_move(board, color, move[0], move[1])
 
         oppo_move, value = minimax_min_node(new_board, color, limit - 1, caching)
-        if caching:
-            cache[(new_board, color)] = (move, value)
 
         if value > curr_max:
             best_move = move
             curr_max = value
 
+    if caching:
+        cache[key] = (to_canonical(board, best_move, cache_symmetry(board, compute_utility)), curr_max)
     return best_move, curr_max
 
 def select_move_minimax(board, color, limit, caching = 0):
@@ -197,26 +960,58 @@ def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering =
     """
     A helper function for alpha-beta that finds the lowest possible utility (don't forget to utilize and update alpha and beta!)
     """
-    if caching and (board, 3 - color, alpha, beta, limit) in cache:
-        return cache[(board, 3 - color, alpha, beta, limit)]
+    check_deadline()
+    if shared_alpha is not None:
+        # another worker of a parallel search already found a root move this good
+        alpha = max(alpha, shared_alpha.value)
+    board = position(board)
+    hash_move = None
+    if caching:
+        key = table_key(board, color, 3 - color)
+        entry = transposition_table.probe(key)
+        if entry is not None:
+            hash_move = from_canonical(board, entry[4], cache_symmetry(board, leaf_evaluation))
+        if entry is not None and entry[1] >= table_depth(board, limit):
+            if entry[3] == EXACT:
+                return hash_move, entry[2]
+            if entry[3] == LOWER:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if beta <= alpha:
+                return hash_move, entry[2]
+        window = (alpha, beta)
 
-    moves = get_possible_moves(board, 3 - color)
+    if limit != 0:
+        empty = empty_squares(board)
+        if empty <= ENDGAME_EMPTIES and (limit < 0 or limit >= empty):
+            best_move, value = solve_endgame(board, 3 - color, color, alpha, beta)
+            if caching:
+                store_result(key, board, limit, window, best_move, value)
+            return best_move, value
 
-    if moves == [] or limit == 0:
+    moves = fast_possible_moves(board, 3 - color)
+
+    if moves == []:
         return (None, compute_utility(board, color))
+    if limit == 0:
+        return (None, leaf_evaluation(board, color))
 
     best_move = None
     curr_min = float("inf")
 
+    flips = {}
     if ordering:
-        moves = sorted(moves, key=lambda move: compute_utility(play_move(board, 3 - color, move[0], move[1]), color))
+        moves, flips = order_moves(board, 3 - color, moves, limit, hash_move)
+    elif hash_move in moves:
+        # the best move found by an earlier (shallower) search is tried first
+        moves.remove(hash_move)
+        moves.insert(0, hash_move)
 
     for move in moves:
-        new_board = play_move(board, 3 - color, move[0], move[1])
+        new_board = fast_play_move(board, 3 - color, move[0], move[1], flips.get(move))
 
         oppo_move, value = alphabeta_max_node(new_board, color, alpha, beta, limit - 1, caching, ordering)
-        if caching:
-            cache[(new_board, 3 - color, alpha, beta, limit)] = (move, value)
 
         if value < curr_min:
             curr_min = value
@@ -225,8 +1020,12 @@ def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering =
         beta = min(beta, curr_min)
 
         if beta <= alpha:
+            if ordering:
+                record_cutoff(3 - color, move, limit)
             break
 
+    if caching:
+        store_result(key, board, limit, window, best_move, curr_min)
     return best_move, curr_min
 
 
@@ -235,26 +1034,58 @@ def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering =
     """
     A helper function for alpha-beta that finds the highest possible utility (don't forget to utilize and update alpha and beta!)
     """
-    if caching and (board, color, alpha, beta, limit) in cache:
-        return cache[(board, color, alpha, beta, limit)]
+    check_deadline()
+    if shared_alpha is not None:
+        # another worker of a parallel search already found a root move this good
+        alpha = max(alpha, shared_alpha.value)
+    board = position(board)
+    hash_move = None
+    if caching:
+        key = table_key(board, color, color)
+        entry = transposition_table.probe(key)
+        if entry is not None:
+            hash_move = from_canonical(board, entry[4], cache_symmetry(board, leaf_evaluation))
+        if entry is not None and entry[1] >= table_depth(board, limit):
+            if entry[3] == EXACT:
+                return hash_move, entry[2]
+            if entry[3] == LOWER:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if beta <= alpha:
+                return hash_move, entry[2]
+        window = (alpha, beta)
 
-    moves = get_possible_moves(board, color)
+    if limit != 0:
+        empty = empty_squares(board)
+        if empty <= ENDGAME_EMPTIES and (limit < 0 or limit >= empty):
+            best_move, value = solve_endgame(board, color, color, alpha, beta)
+            if caching:
+                store_result(key, board, limit, window, best_move, value)
+            return best_move, value
 
-    if moves == [] or limit == 0:
+    moves = fast_possible_moves(board, color)
+
+    if moves == []:
         return (None, compute_utility(board, color))
+    if limit == 0:
+        return (None, leaf_evaluation(board, color))
 
     best_move = None
     curr_max = float("-inf")
 
+    flips = {}
     if ordering:
-        moves = sorted(moves, key=lambda mv: compute_utility(play_move(board, color, mv[0], mv[1]), color), reverse=True)
+        moves, flips = order_moves(board, color, moves, limit, hash_move)
+    elif hash_move in moves:
+        # the best move found by an earlier (shallower) search is tried first
+        moves.remove(hash_move)
+        moves.insert(0, hash_move)
 
     for move in moves:
-        new_board = play_move(board, color, move[0], move[1])
+        new_board = fast_play_move(board, color, move[0], move[1], flips.get(move))
         
         oppo_move, value = alphabeta_min_node(new_board, color, alpha, beta, limit - 1, caching, ordering)
-        if caching:
-            cache[(new_board, color, alpha, beta, limit)] = (move, value)
     
         if value > curr_max:
             curr_max = value
@@ -263,8 +1094,12 @@ def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering =
         alpha = max(alpha, curr_max)
 
         if beta <= alpha:
+            if ordering:
+                record_cutoff(color, move, limit)
             break
 
+    if caching:
+        store_result(key, board, limit, window, best_move, curr_max)
     return best_move, curr_max
 
 def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0):
@@ -283,8 +1118,178 @@ def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0):
     OUTPUT: a tuple of integers (i,j) representing a move, where i is the column and j is the row on the board.
     """
     # cache.clear()
+    use_evaluation(compute_utility)
+    transposition_table.new_search()
+    age_history()
     return alphabeta_max_node(board, color, float("-inf"), float("inf"), limit, caching, ordering)[0]
 
+############ ITERATIVE DEEPENING ###################
+# Without a depth limit, run_ai searches depth 1, 2, 3, ... until the time for the move is used up, and plays the best
+# move of the deepest search that finished. With state caching on, the searches share the transposition table, so each
+# one starts with the best moves of the previous one. Non-terminal positions at the depth limit are evaluated with
+# search_evaluation.
+MOVE_TIME = 5.0 # seconds per move
+DEADLINE_CHECK_EVERY = 256 # nodes between two looks at the clock
+DEPTH_GROWTH = 4 # a search is expected to take this many times as long as the one a level shallower
+
+class SearchTimeout(Exception):
+    pass
+
+search_deadline = None # time.time() at which the current search must stop, None without a time limit
+search_nodes = 0
+leaf_evaluation = compute_utility # value of non-terminal positions at the depth limit
+
+# Evaluations that give the same value on the 8 rotations and reflections of a board. With one of them at the depth
+# limit the caches share their entries between the images of a position (see cache_symmetry); any other evaluation
+# keys every board on itself. Exact values (the end of the game, the endgame solver) are always the same on every image.
+SYMMETRIC_EVALUATIONS = (compute_utility, compute_heuristic, compute_pattern_heuristic)
+
+def check_deadline():
+    global search_nodes
+    search_nodes += 1
+    if search_deadline is not None and search_nodes % DEADLINE_CHECK_EVERY == 0 and time.time() > search_deadline:
+        raise SearchTimeout()
+
+def use_evaluation(evaluation):
+    """
+    Evaluate non-terminal positions at the depth limit with evaluation, forgetting the values found with another one.
+    """
+    global leaf_evaluation
+    if evaluation is not leaf_evaluation:
+        leaf_evaluation = evaluation
+        transposition_table.clear()
+
+def select_move_iterative(board, color, move_time = MOVE_TIME, caching = 0, ordering = 0):
+    """
+    Given a board and a player color, decide on a move using Alpha-Beta with iterative deepening.
+    INPUT: a game state, the player that is in control, the seconds the search may take, a flag determining whether
+    state caching is on or not (with it, every depth starts with the best moves the previous one stored), and a flag
+    determining whether node ordering is on or not
+    OUTPUT: a tuple of integers (i,j) representing a move, where i is the column and j is the row on the board.
+    """
+    global search_deadline
+    start = time.time()
+    board = position(board)
+    moves = fast_possible_moves(board, color)
+    if not moves:
+        return None
+    best_move = moves[0]
+    empty = popcount(bitboard(len(board)).full & ~(board.dark | board.light))
+    use_evaluation(search_evaluation(board))
+    search_deadline = start + move_time
+    completed = 0
+    try:
+        while True:
+            depth_start = time.time()
+            transposition_table.new_search()
+            age_history()
+            best_move = alphabeta_max_node(board, color, float("-inf"), float("inf"), completed + 1, caching, ordering)[0]
+            completed += 1
+            now = time.time()
+            # the search reached the end of every line, or the next one is not expected to finish in time
+            if completed >= empty or now + (now - depth_start) * DEPTH_GROWTH > search_deadline:
+                break
+    except SearchTimeout:
+        pass
+    finally:
+        search_deadline = None
+    return best_move
+
+############ PARALLEL SEARCH #######################
+# On more than one core, every depth of the iterative deepening is split at the root. The first root move (the best
+# one of the previous depth) is searched alone, and its value becomes the alpha of the other root moves, which a pool of
+# worker processes searches in parallel (young brothers wait). A worker that finds a better root move publishes its
+# value and index in shared memory, and all workers raise their alpha to the shared value at every node, so they only
+# search for moves that beat the best one found anywhere. Every worker has its own transposition table.
+shared_alpha = None # in the worker processes: the best value found at the root of the current depth
+shared_best = None # in the worker processes: the index of the root move with that value
+
+def parallel_search(processes = None):
+    """
+    A pool of worker processes for select_move_parallel, with the shared root value and move they report to.
+    """
+    alpha = multiprocessing.Value("d", float("-inf"))
+    best = multiprocessing.Value("i", -1)
+    pool = multiprocessing.Pool(processes, initializer=parallel_init, initargs=(alpha, best))
+    return pool, alpha, best
+
+def parallel_init(alpha, best):
+    global shared_alpha, shared_best
+    shared_alpha = alpha
+    shared_best = best
+
+def search_root_move(task):
+    """
+    Search a root move in a worker process. Returns its value, None if the deadline passed first.
+    """
+    global search_deadline
+    (board, color, move, index, depth, caching, ordering, deadline) = task
+    use_evaluation(search_evaluation(board))
+    search_deadline = deadline
+    transposition_table.new_search()
+    try:
+        new_board = fast_play_move(board, color, move[0], move[1])
+        value = alphabeta_min_node(new_board, color, shared_alpha.value, float("inf"), depth - 1, caching, ordering)[1]
+    except SearchTimeout:
+        return None
+    finally:
+        search_deadline = None
+    with shared_alpha.get_lock():
+        if value > shared_alpha.value:
+            shared_alpha.value = value
+            shared_best.value = index
+    return value
+
+def select_move_parallel(board, color, parallel, move_time = MOVE_TIME, caching = 0, ordering = 0):
+    """
+    Given a board and a player color, decide on a move like select_move_iterative, splitting every depth across the
+    worker processes of parallel (see parallel_search).
+    INPUT: a game state, the player that is in control, the worker pool, the seconds the search may take, a flag
+    determining whether state caching is on or not, and a flag determining whether node ordering is on or not
+    OUTPUT: a tuple of integers (i,j) representing a move, where i is the column and j is the row on the board.
+    """
+    global search_deadline
+    (pool, alpha, best) = parallel
+    start = time.time()
+    board = position(board)
+    moves = fast_possible_moves(board, color)
+    if len(moves) <= 1:
+        return moves[0] if moves else None
+    best_move = moves[0]
+    values = {} # root move -> its value in the last completed depth, an upper bound for most of them
+    empty = popcount(bitboard(len(board)).full & ~(board.dark | board.light))
+    use_evaluation(search_evaluation(board))
+    deadline = start + move_time
+    completed = 0
+    while True:
+        depth = completed + 1
+        depth_start = time.time()
+        moves.sort(key=lambda move: (move == best_move, values.get(move, float("-inf"))), reverse=True)
+        search_deadline = deadline
+        transposition_table.new_search()
+        age_history()
+        try:
+            first = fast_play_move(board, color, moves[0][0], moves[0][1])
+            value = alphabeta_min_node(first, color, float("-inf"), float("inf"), depth - 1, caching, ordering)[1]
+        except SearchTimeout:
+            break
+        finally:
+            search_deadline = None
+        alpha.value = value
+        best.value = 0
+        tasks = [(board, color, move, index, depth, caching, ordering, deadline)
+                 for (index, move) in enumerate(moves) if index > 0]
+        results = pool.map(search_root_move, tasks)
+        if None in results:
+            break
+        values = dict(zip(moves, [value] + results))
+        best_move = moves[best.value]
+        completed = depth
+        now = time.time()
+        if completed >= empty or now + (now - depth_start) * DEPTH_GROWTH > deadline:
+            break
+    return best_move
+
 ####################################################
 def run_ai():
     """
@@ -315,6 +1320,11 @@ def run_ai():
 
     if (minimax == 1 and ordering == 1): eprint("Node Ordering should have no impact on Minimax")
 
+    parallel = None
+    if (minimax == 0 and limit == -1 and multiprocessing.cpu_count() > 1):
+        parallel = parallel_search()
+        eprint("Searching on", multiprocessing.cpu_count(), "cores")
+
     while True: # This is the main loop
         # Read in the current game status, for example:
         # "SCORE 2 2" or "FINAL 33 31" if the game is over.
@@ -335,8 +1345,17 @@ def run_ai():
                                   # 2 : light disk (player 2)
 
             # Select the move and send it to the manager
-            if (minimax == 1): # run this if the minimax flag is given
+            move = None
+            if (minimax == 0): # alpha-beta plays from the opening book as long as the position is in it
+                move = book_move(board, color)
+            if (move is not None):
+                movei, movej = move
+            elif (minimax == 1): # run this if the minimax flag is given
                 movei, movej = select_move_minimax(board, color, limit, caching)
+            elif (limit == -1 and parallel is not None): # without a depth limit, search as deep as the time allows
+                movei, movej = select_move_parallel(board, color, parallel, MOVE_TIME, caching, ordering)
+            elif (limit == -1):
+                movei, movej = select_move_iterative(board, color, MOVE_TIME, caching, ordering)
             else: # else run alphabeta
                 movei, movej = select_move_alphabeta(board, color, limit, caching, ordering)
             
@@ -0,0 +1,57 @@
+'''Offline builder of the opening book of agent.py.
+
+Walks every position of the first plies of the game (once per class of symmetric positions), searches each one with
+alpha-beta to a fixed depth and writes the best moves to book_<n>.bin, which run_ai reads through mmap.
+
+    python build_book.py --size 8 --plies 8 --depth 8
+'''
+
+import argparse
+import time
+
+import agent
+
+
+def build_book(n, plies, depth, ordering=1):
+    '''{key: (square, value)} of the positions of the first plies of the game with n x n boards'''
+    bits = agent.bitboard(n)
+    entries = {}
+    frontier = [(agent.starting_board(n), 1)]
+    for ply in range(plies):
+        following = {}
+        for (board, color) in frontier:
+            moves = agent.fast_possible_moves(board, color)
+            if not moves:
+                color = 3 - color  # the player passes
+                moves = agent.fast_possible_moves(board, color)
+                if not moves:
+                    continue
+            (key, symmetry) = agent.canonical_position(board, color)
+            if key in entries:
+                continue
+            agent.use_evaluation(agent.search_evaluation(board))
+            agent.transposition_table.new_search()
+            agent.age_history()
+            (move, value) = agent.alphabeta_max_node(board, color, float('-inf'), float('inf'), depth, 1, ordering)
+            entries[key] = (bits.symmetries[symmetry][move[0] + move[1] * n], value)
+            for (i, j) in moves:
+                child = agent.fast_play_move(board, color, i, j)
+                following.setdefault(agent.canonical_position(child, 3 - color)[0], (child, 3 - color))
+        frontier = list(following.values())
+        print('ply %d: %d positions in the book' % (ply + 1, len(entries)))
+    return entries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the opening book of agent.py.')
+    parser.add_argument('--size', type=int, default=8, help='board size')
+    parser.add_argument('--plies', type=int, default=6, help='plies of the game the book covers')
+    parser.add_argument('--depth', type=int, default=6, help='depth of the search of every position')
+    parser.add_argument('--out', default=None, help='output file (default: book_<size>.bin next to agent.py)')
+    args = parser.parse_args()
+
+    start = time.time()
+    entries = build_book(args.size, args.plies, args.depth)
+    out = args.out or agent.book_path(args.size)
+    agent.save_book(args.size, entries, out)
+    print('saved %d positions to %s in %.1f seconds' % (len(entries), out, time.time() - start))
@@ -0,0 +1,141 @@
+'''Regression tests of agent.py, run with python -m unittest test_agent (needs othello_shared.py of the assignment
+next to agent.py)'''
+
+import array
+import random
+import types
+import unittest
+
+import agent
+
+
+def random_position(n, rng):
+    '''(board, player to move) after a random number of random moves from the start'''
+    board = agent.starting_board(n)
+    color = 1
+    for _ in range(rng.randrange(n * n - 4)):
+        moves = agent.fast_possible_moves(board, color)
+        if not moves:
+            break
+        move = rng.choice(moves)
+        board = agent.fast_play_move(board, color, move[0], move[1])
+        color = 3 - color
+    return board, color
+
+
+def images(board):
+    '''The 8 rotations and reflections of board'''
+    bits = agent.bitboard(len(board))
+    return [agent.position(bits.to_rows(bits.transform(board.dark, t), bits.transform(board.light, t)))
+            for t in range(8)]
+
+
+class PatternSymmetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(agent.pattern_tables)
+
+    def tearDown(self):
+        agent.pattern_tables.clear()
+        agent.pattern_tables.update(self.saved)
+
+    def test_same_value_on_every_image(self):
+        rng = random.Random(384)
+        for n in (6, 8):
+            # random tables, so that no entry is the same as the one of its mirror reading by chance
+            sizes = [3 ** len(patterns[0]) for (name, patterns) in agent.pattern_groups_of(n)]
+            agent.pattern_tables[n] = [[array.array('f', [rng.uniform(-10, 10) for _ in range(size)]) for size in sizes]
+                                       for _ in range(agent.PATTERN_PHASES)]
+            for _ in range(20):
+                (board, color) = random_position(n, rng)
+                values = [agent.compute_pattern_heuristic(image, color) for image in images(board)]
+                for value in values:
+                    self.assertAlmostEqual(value, values[0], places=3)
+
+
+def corner_evaluation(board, color):
+    '''An evaluation that is not the same on every image of a board: 1 if color has the first square'''
+    return 1 if board[0][0] == color else 0
+
+
+class CacheSymmetryTest(unittest.TestCase):
+    '''Values read from the caches, filled while searching the other images of a position, are those of a search
+    with empty caches'''
+
+    def setUp(self):
+        self.saved = dict(agent.pattern_tables)
+        self.rng = random.Random(25)
+
+    def tearDown(self):
+        agent.pattern_tables.clear()
+        agent.pattern_tables.update(self.saved)
+        agent.use_evaluation(agent.compute_utility)
+
+    def positions(self, n, count):
+        return [random_position(n, self.rng) for _ in range(count)]
+
+    def alphabeta(self, board, color, caching):
+        agent.transposition_table.new_search()
+        return agent.alphabeta_max_node(board, color, float("-inf"), float("inf"), 3, caching, 0)[1]
+
+    def check_alphabeta(self, evaluation):
+        agent.use_evaluation(evaluation)
+        for (board, color) in self.positions(6, 10):
+            if not agent.fast_possible_moves(board, color):
+                continue
+            agent.transposition_table.clear()
+            for image in images(board):
+                self.assertAlmostEqual(self.alphabeta(image, color, 1), self.alphabeta(image, color, 0), places=3)
+
+    def test_minimax(self):
+        for (board, color) in self.positions(6, 10):
+            agent.cache.clear()
+            for image in images(board):
+                (move, value) = agent.minimax_max_node(image, color, 3, 1)
+                self.assertEqual(value, agent.minimax_max_node(image, color, 3, 0)[1])
+                if move is not None:
+                    self.assertIn(move, agent.fast_possible_moves(image, color))
+
+    def test_alphabeta_with_pattern_evaluation(self):
+        sizes = [3 ** len(patterns[0]) for (name, patterns) in agent.pattern_groups_of(6)]
+        agent.pattern_tables[6] = [[array.array('f', [self.rng.uniform(-10, 10) for _ in range(size)]) for size in sizes]
+                                   for _ in range(agent.PATTERN_PHASES)]
+        self.check_alphabeta(agent.compute_pattern_heuristic)
+
+    def test_alphabeta_with_asymmetric_evaluation(self):
+        self.check_alphabeta(corner_evaluation)
+
+
+class IterativeCachingTest(unittest.TestCase):
+
+    def tearDown(self):
+        agent.use_evaluation(agent.compute_utility)
+
+    def test_caching_off_leaves_the_table_alone(self):
+        (board, color) = random_position(6, random.Random(18))
+        agent.transposition_table.clear()
+        agent.select_move_iterative(board, color, 0.5, 0, 1)
+        self.assertEqual(agent.transposition_table.slots.count(None), len(agent.transposition_table.slots))
+        agent.select_move_iterative(board, color, 0.5, 1, 1)
+        self.assertLess(agent.transposition_table.slots.count(None), len(agent.transposition_table.slots))
+
+
+class ParallelStoreTest(unittest.TestCase):
+
+    def tearDown(self):
+        agent.shared_alpha = None
+        agent.transposition_table.clear()
+
+    def test_value_below_the_shared_alpha_is_an_upper_bound(self):
+        # another worker raised the shared alpha while the node was searched: its children failed low against it
+        (board, color) = random_position(6, random.Random(20))
+        board = agent.position(board)
+        move = agent.fast_possible_moves(board, color)[0]
+        key = agent.table_key(board, color, color)
+        agent.shared_alpha = types.SimpleNamespace(value=5)
+        agent.store_result(key, board, 2, (float("-inf"), float("inf")), move, 3)
+        self.assertEqual(agent.transposition_table.probe(key)[3], agent.UPPER)
+
+
+if __name__ == '__main__':
+    unittest.main()
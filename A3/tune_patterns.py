@@ -0,0 +1,101 @@
+'''Offline tuning of the pattern tables of agent.py.
+
+Plays games of the agent against itself, with a share of random moves so that the positions vary, and fits the pattern
+tables by least squares (stochastic gradient descent) so that the value of a position predicts the final disk
+difference of its game. Every position is used from both sides. The tables are written to patterns_<n>.bin, where
+agent.py picks them up.
+
+    python tune_patterns.py --size 8 --games 5000 --epochs 15
+'''
+
+import argparse
+import array
+import random
+import time
+
+import agent
+
+
+def play_game(n, rng, epsilon):
+    '''Positions of one game and its final disk difference (dark minus light). Each move is random with probability
+    epsilon, else the move that leaves the opponent with the lowest compute_heuristic.'''
+    board = agent.starting_board(n)
+    color = 1
+    positions = []
+    while True:
+        moves = agent.fast_possible_moves(board, color)
+        if not moves:
+            color = 3 - color
+            if not agent.fast_possible_moves(board, color):
+                break
+            continue
+        if rng.random() < epsilon:
+            move = rng.choice(moves)
+        else:
+            move = min(moves, key=lambda m: agent.compute_heuristic(agent.fast_play_move(board, color, m[0], m[1]), 3 - color))
+        board = agent.fast_play_move(board, color, move[0], move[1])
+        color = 3 - color
+        positions.append(board)
+    return positions, board.counts[0] - board.counts[1]
+
+
+def generate_samples(n, games, epsilon, seed):
+    '''(phase, pattern indices, final disk difference) of every position of the games, for both players'''
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(games):
+        positions, result = play_game(n, rng, epsilon)
+        for board in positions:
+            phase = agent.pattern_phase(board)
+            samples.append((phase, agent.pattern_indices(board, 1), result))
+            samples.append((phase, agent.pattern_indices(board, 2), -result))
+    return samples
+
+
+def error(tables, samples):
+    '''Root mean square error of the tables on samples'''
+    total = 0.0
+    for (phase, indices, target) in samples:
+        total += (target - sum(tables[phase][group][index] for (group, index) in indices)) ** 2
+    return (total / max(len(samples), 1)) ** 0.5
+
+
+def fit(n, samples, validation, epochs, rate, seed):
+    '''Tables fitted to samples, reporting the error on the validation samples after every epoch'''
+    sizes = [3 ** len(patterns[0]) for (name, patterns) in agent.pattern_groups_of(n)]
+    tables = [[array.array('f', [0.0]) * size for size in sizes] for _ in range(agent.PATTERN_PHASES)]
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(samples)
+        for (phase, indices, target) in samples:
+            phase_tables = tables[phase]
+            step = rate * (target - sum(phase_tables[group][index] for (group, index) in indices)) / len(indices)
+            for (group, index) in indices:
+                phase_tables[group][index] += step
+        print('epoch %d: training error %.3f, validation error %.3f' % (epoch + 1, error(tables, samples),
+                                                                         error(tables, validation)))
+    return tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the pattern tables of agent.py on games of self-play.')
+    parser.add_argument('--size', type=int, default=8, help='board size')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--epsilon', type=float, default=0.2, help='share of random moves in the games')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=0.05, help='learning rate')
+    parser.add_argument('--validation', type=float, default=0.1, help='share of the games kept for validation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='output file (default: patterns_<size>.bin next to agent.py)')
+    args = parser.parse_args()
+
+    start = time.time()
+    held_out = int(args.games * args.validation)
+    samples = generate_samples(args.size, args.games - held_out, args.epsilon, args.seed)
+    validation = generate_samples(args.size, held_out, args.epsilon, args.seed + 1)
+    print('%d training and %d validation positions in %.1f seconds' % (len(samples), len(validation),
+                                                                          time.time() - start))
+    tables = fit(args.size, samples, validation, args.epochs, args.rate, args.seed)
+    out = args.out or agent.pattern_path(args.size)
+    agent.save_patterns(args.size, tables, out)
+    print('saved', out)